@@ -0,0 +1,206 @@
+"""
+截圖封存
+將截圖依序寫入大小有上限的 tar 分片，並以 index.csv 記錄每張截圖所在的分片與位移，
+可直接依帳號名稱讀取，不必解開整個分片
+"""
+
+import csv
+import glob
+import os
+import tarfile
+import time
+
+
+ARCHIVE_INDEX = 'index.csv'
+INDEX_FIELDS = ['username', 'captured_at', 'shard', 'offset', 'size']
+SHARD_MAX_BYTES = 512 * 1024 * 1024
+
+# {archive_dir: (index.csv 的修改時間, {username: [索引列, ...]})}
+_index_cache = {}
+
+
+def _shard_name(number):
+    return f"shard-{number:05d}.tar"
+
+
+def load_archive_index(archive_dir):
+    """讀取封存索引，返回 {username: [索引列（依截圖時間排序）]}"""
+    index_path = os.path.join(archive_dir, ARCHIVE_INDEX)
+    if not os.path.exists(index_path):
+        return {}
+
+    mtime = os.path.getmtime(index_path)
+    cached = _index_cache.get(archive_dir)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    entries = {}
+    with open(index_path, 'r', newline='', encoding='utf-8') as csvfile:
+        for row in csv.DictReader(csvfile):
+            row['offset'] = int(row['offset'])
+            row['size'] = int(row['size'])
+            entries.setdefault(row['username'], []).append(row)
+    for rows in entries.values():
+        rows.sort(key=lambda row: row['captured_at'])
+    _index_cache[archive_dir] = (mtime, entries)
+    return entries
+
+
+def _current_shard(archive_dir, incoming_size, max_bytes):
+    """返回要寫入的分片路徑；目前分片加上新資料會超過上限時開新分片"""
+    shards = sorted(glob.glob(os.path.join(archive_dir, 'shard-*.tar')))
+    if shards:
+        last = shards[-1]
+        if os.path.getsize(last) + incoming_size + 1024 <= max_bytes:
+            return last
+        number = int(os.path.basename(last)[6:11]) + 1
+    else:
+        number = 0
+    return os.path.join(archive_dir, _shard_name(number))
+
+
+def _last_index_entry(index_path):
+    """只讀取 index.csv 的最後一行，返回最後寫入的索引列（沒有時返回 None）"""
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(max(size - 4096, 0))
+        lines = f.read().decode('utf-8').splitlines()
+    lines = [line for line in lines if line.strip()]
+    if not lines:
+        return None
+    row = next(csv.reader([lines[-1]]))
+    if row == INDEX_FIELDS or len(row) != len(INDEX_FIELDS):
+        return None
+    entry = dict(zip(INDEX_FIELDS, row))
+    entry['offset'] = int(entry['offset'])
+    entry['size'] = int(entry['size'])
+    return entry
+
+
+def _shard_end(shard_path, last_entry):
+    """分片中最後一個成員結束的位置（下一個標頭的寫入位置）
+
+    由 index.csv 最後一列的位移與大小算出，不必走訪分片內所有標頭；
+    索引與分片對不上時（例如寫入分片後、寫入索引前中斷）才以 tarfile 走訪
+    """
+    if not os.path.exists(shard_path):
+        return 0
+    if last_entry and last_entry['shard'] == os.path.basename(shard_path):
+        end = last_entry['offset'] + last_entry['size']
+        return -(-end // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+    with tarfile.open(shard_path, 'r') as tar:
+        members = tar.getmembers()
+    if not members:
+        return 0
+    last = members[-1]
+    return last.offset_data + -(-last.size // tarfile.BLOCKSIZE) * tarfile.BLOCKSIZE
+
+
+def append_capture(archive_dir, username, data, captured_at=None, max_bytes=SHARD_MAX_BYTES):
+    """將一張截圖（PNG bytes）寫入封存，返回索引列
+
+    新成員直接寫在最後一個成員之後（位置由索引最後一列算出），再補上 tar 結尾的兩個空白區塊，
+    每次寫入的成本與分片內已有的截圖數量無關
+    同一個 archive_dir 一次只能有一個寫入者；多個 worker 請各自使用不同的資料夾
+    """
+    os.makedirs(archive_dir, exist_ok=True)
+    captured_at = captured_at or time.strftime('%Y%m%dT%H%M%S')
+    shard_path = _current_shard(archive_dir, len(data), max_bytes)
+    index_path = os.path.join(archive_dir, ARCHIVE_INDEX)
+
+    info = tarfile.TarInfo(name=f"{username}/{captured_at}.png")
+    info.size = len(data)
+    info.mtime = time.time()
+    header = info.tobuf(tarfile.PAX_FORMAT, tarfile.ENCODING, 'surrogateescape')
+    padding = -len(data) % tarfile.BLOCKSIZE
+
+    start = _shard_end(shard_path, _last_index_entry(index_path))
+    # 資料位移 = 寫入位置 + 標頭長度
+    data_offset = start + len(header)
+    with open(shard_path, 'r+b' if os.path.exists(shard_path) else 'wb') as f:
+        f.seek(start)
+        f.write(header)
+        f.write(data)
+        f.write(tarfile.NUL * (padding + 2 * tarfile.BLOCKSIZE))
+        f.truncate()
+
+    entry = {
+        'username': username,
+        'captured_at': captured_at,
+        'shard': os.path.basename(shard_path),
+        'offset': data_offset,
+        'size': len(data),
+    }
+    write_header = not os.path.exists(index_path)
+    with open(index_path, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=INDEX_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerow(entry)
+    return entry
+
+
+def archive_capture_file(archive_dir, username, path, remove=True, captured_at=None):
+    """將已存檔的截圖寫入封存，預設會刪除原本的散檔"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        if captured_at is None:
+            captured_at = time.strftime('%Y%m%dT%H%M%S', time.localtime(os.path.getmtime(path)))
+        entry = append_capture(archive_dir, username, data, captured_at)
+        if remove:
+            os.remove(path)
+        print(f"已封存至 {entry['shard']}")
+        return entry
+    except Exception as e:
+        print(f"封存截圖時發生錯誤: {e}")
+        return None
+
+
+def read_capture(archive_dir, username, captured_at=None):
+    """依帳號名稱讀取截圖（預設為最新一張），找不到時返回 None"""
+    rows = load_archive_index(archive_dir).get(username)
+    if not rows:
+        return None
+    if captured_at is None:
+        entry = rows[-1]
+    else:
+        entry = next((row for row in rows if row['captured_at'] == captured_at), None)
+        if entry is None:
+            return None
+
+    with open(os.path.join(archive_dir, entry['shard']), 'rb') as f:
+        f.seek(entry['offset'])
+        return f.read(entry['size'])
+
+
+def list_captures(archive_dir, username):
+    """返回該帳號所有截圖的時間"""
+    return [row['captured_at'] for row in load_archive_index(archive_dir).get(username, [])]
+
+
+def pack_image_folder(image_folder, archive_dir, remove=False):
+    """將既有資料夾內的 PNG 散檔依序寫入封存"""
+    paths = sorted(glob.glob(os.path.join(image_folder, '*.png')))
+    count = 0
+    for path in paths:
+        username = os.path.splitext(os.path.basename(path))[0]
+        if archive_capture_file(archive_dir, username, path, remove):
+            count += 1
+    print(f"已封存 {count} / {len(paths)} 張截圖到 {archive_dir}")
+    return count
+
+
+def main():
+    """主函數：將 image 資料夾的截圖封存"""
+    image_folder = 'image'
+    archive_dir = 'image_archive'
+
+    pack_image_folder(image_folder, archive_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+截圖品質檢查
+將截圖縮小後以 NumPy 計算統計值，找出空白、未載入完成或被登入視窗遮住的截圖
+"""
+
+import time
+
+import numpy as np
+from PIL import Image
+
+
+# 縮小後的目標寬度（像素）與區塊大小
+CHECK_WIDTH = 128
+BLOCK_SIZE = 8
+
+# 判定門檻
+BLANK_BLOCK_STD = 2.0        # 區塊內亮度標準差低於此值視為空白
+BLANK_RATIO_MAX = 0.85       # 空白區塊比例上限
+SEGMENT_SIMILARITY_MAX = 0.995  # 相鄰段落相似度上限（過高代表滾動未生效、重複截到同一畫面）
+OVERLAY_LUMA_MAX = 90        # 遮罩像素的亮度上限
+OVERLAY_CHROMA_MAX = 24      # 遮罩像素的色度上限（灰黑色）
+OVERLAY_RATIO_MAX = 0.6      # 遮罩像素比例上限
+
+
+def _to_luma(rgb):
+    """RGB 陣列轉為亮度"""
+    return rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+
+def _shrink(image, factor):
+    """縮小圖片，返回 RGB 的 float32 陣列"""
+    if factor > 1:
+        image = image.reduce(factor)
+    return np.asarray(image.convert('RGB'), dtype=np.float32)
+
+
+def score_capture(image, segment_height=None):
+    """計算截圖的品質分數（image 可為路徑或 PIL 圖片）
+
+    segment_height 為拼接時每張截圖的高度（原始像素），至少拼接兩張時才比較相鄰段落；
+    單張截圖（區域截圖、單一畫面的頁面）下半部常是空白，平均切段比較會誤判為重複畫面
+    """
+    start = time.perf_counter()
+    if not isinstance(image, Image.Image):
+        image = Image.open(image)
+    factor = max(1, image.width // CHECK_WIDTH)
+
+    # 依拼接邊界從原圖切出每一張再各自縮小，避免縮小後邊界對不齊
+    segment_height = int(segment_height or 0)
+    segment_count = image.height // segment_height if segment_height else 0
+    if segment_count >= 2:
+        parts = [
+            _shrink(image.crop((0, i * segment_height, image.width, (i + 1) * segment_height)), factor)
+            for i in range(segment_count)
+        ]
+        segments = np.stack([_to_luma(part) for part in parts])
+        if image.height > segment_count * segment_height:
+            parts.append(_shrink(image.crop((0, segment_count * segment_height, image.width, image.height)), factor))
+        rgb = np.concatenate(parts)
+        luma = _to_luma(rgb)
+    else:
+        rgb = _shrink(image, factor)
+        luma = _to_luma(rgb)
+        segments = None
+    height, width = luma.shape
+
+    # 空白比例：以區塊為單位計算亮度標準差
+    rows = height // BLOCK_SIZE * BLOCK_SIZE
+    cols = width // BLOCK_SIZE * BLOCK_SIZE
+    if rows and cols:
+        blocks = luma[:rows, :cols].reshape(rows // BLOCK_SIZE, BLOCK_SIZE, cols // BLOCK_SIZE, BLOCK_SIZE)
+        block_std = blocks.std(axis=(1, 3))
+        blank_ratio = float((block_std < BLANK_BLOCK_STD).mean())
+    else:
+        blank_ratio = float(luma.std() < BLANK_BLOCK_STD)
+
+    # 相鄰段落相似度：取最相似的一組（非拼接的截圖維持 0）
+    segment_similarity = 0.0
+    if segments is not None:
+        diffs = np.abs(np.diff(segments, axis=0)).mean(axis=(1, 2))
+        segment_similarity = float(1 - diffs.min() / 255)
+
+    # 遮罩特徵：偏暗且接近灰黑的像素比例（登入視窗的半透明黑色背景）
+    chroma = rgb.max(axis=2) - rgb.min(axis=2)
+    overlay_ratio = float(((luma < OVERLAY_LUMA_MAX) & (chroma < OVERLAY_CHROMA_MAX)).mean())
+
+    return {
+        'blank_ratio': blank_ratio,
+        'segment_similarity': segment_similarity,
+        'overlay_ratio': overlay_ratio,
+        'elapsed_ms': (time.perf_counter() - start) * 1000,
+    }
+
+
+def capture_problems(scores):
+    """依分數返回問題列表，空列表表示截圖正常"""
+    problems = []
+    if scores['blank_ratio'] > BLANK_RATIO_MAX:
+        problems.append('blank')
+    elif scores['segment_similarity'] > SEGMENT_SIMILARITY_MAX:
+        # 全白頁面的段落也會很相似，已判定空白時不重複列出
+        problems.append('repeated_segments')
+    if scores['overlay_ratio'] > OVERLAY_RATIO_MAX:
+        problems.append('overlay')
+    return problems
+
+
+def check_capture(image, segment_height=None):
+    """檢查截圖，返回 (問題列表, 分數)"""
+    try:
+        scores = score_capture(image, segment_height)
+    except Exception as e:
+        print(f"檢查截圖時發生錯誤: {e}")
+        return ['unreadable'], None
+    return capture_problems(scores), scores
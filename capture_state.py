@@ -0,0 +1,248 @@
+"""
+截圖狀態紀錄
+以 CSV 記錄每個 URL 的截圖結果分類、嘗試次數與下次重試時間
+處理過程中每筆結果只附加一列（同一 URL 以最後一列為準），結束或讀取時發現重複過多才整份重寫
+"""
+
+import csv
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+
+STATE_FIELDS = ['url', 'status', 'attempts', 'last_attempt_at', 'next_retry_at', 'message']
+
+# 結果分類
+STATUS_OK = 'ok'
+STATUS_PRIVATE = 'private'
+STATUS_NOT_FOUND = 'not_found'
+STATUS_RATE_LIMITED = 'rate_limited'
+STATUS_LOGIN_WALL = 'login_wall'
+STATUS_TIMEOUT = 'timeout'
+STATUS_ERROR = 'error'
+STATUS_BAD_CAPTURE = 'bad_capture'
+
+# 已完成（私人帳號仍可截取標頭，視為完成）
+DONE_STATUSES = {STATUS_OK, STATUS_PRIVATE}
+# 永久失敗，不再重試
+PERMANENT_STATUSES = {STATUS_NOT_FOUND}
+# 暫時性失敗，延後重試
+TRANSIENT_STATUSES = {STATUS_RATE_LIMITED, STATUS_LOGIN_WALL, STATUS_TIMEOUT, STATUS_ERROR, STATUS_BAD_CAPTURE}
+
+# 重試設定：第 n 次失敗後等待 base * 2^(n-1) 秒（上限 RETRY_MAX_DELAY），超過 MAX_ATTEMPTS 次放棄
+RETRY_BASE_DELAY = {
+    STATUS_RATE_LIMITED: 300,
+    STATUS_LOGIN_WALL: 120,
+    STATUS_TIMEOUT: 30,
+    STATUS_ERROR: 30,
+    STATUS_BAD_CAPTURE: 60,
+}
+RETRY_MAX_DELAY = 3600
+MAX_ATTEMPTS = 4
+
+
+# 附加的列數超過不重複 URL 數的幾倍時，讀取後整份重寫
+STATE_COMPACT_RATIO = 2
+
+
+def load_capture_state(state_filename):
+    """讀取狀態檔，返回 {url: row}（同一 URL 有多列時以最後一列為準）"""
+    state = {}
+    if not os.path.exists(state_filename):
+        return state
+    row_count = 0
+    try:
+        with open(state_filename, 'r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if row.get('url'):
+                    state[row['url']] = row
+                    row_count += 1
+    except Exception as e:
+        print(f"讀取狀態檔時發生錯誤: {e}")
+        return state
+    if row_count > STATE_COMPACT_RATIO * len(state):
+        save_capture_state(state_filename, state)
+    return state
+
+
+def save_capture_state(state_filename, state):
+    """以暫存檔加 os.replace 的方式整份寫回狀態檔（每個 URL 一列），避免中斷時留下不完整的檔案"""
+    tmp_path = None
+    try:
+        directory = os.path.dirname(os.path.abspath(state_filename))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=STATE_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(state.values())
+        os.replace(tmp_path, state_filename)
+        tmp_path = None
+        return True
+    except Exception as e:
+        print(f"寫入狀態檔時發生錯誤: {e}")
+        return False
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def append_capture_state(state_filename, rows):
+    """將有變動的列附加到狀態檔，不重寫整份檔案"""
+    try:
+        write_header = not os.path.exists(state_filename) or os.path.getsize(state_filename) == 0
+        with open(state_filename, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=STATE_FIELDS, extrasaction='ignore')
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+        return True
+    except Exception as e:
+        print(f"寫入狀態檔時發生錯誤: {e}")
+        return False
+
+
+def retry_delay(status, attempts):
+    """計算第 attempts 次失敗後的等待秒數（指數退避加隨機抖動）"""
+    base = RETRY_BASE_DELAY.get(status, RETRY_BASE_DELAY[STATUS_ERROR])
+    delay = min(base * 2 ** (attempts - 1), RETRY_MAX_DELAY)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def record_outcome(state, url, status, message=''):
+    """記錄一次截圖結果，返回下次重試時間（不需重試時返回 None）"""
+    row = state.get(url) or {'url': url, 'attempts': '0'}
+    attempts = int(row.get('attempts') or 0) + 1
+    now = time.time()
+
+    next_retry_at = None
+    if status in TRANSIENT_STATUSES and attempts < MAX_ATTEMPTS:
+        next_retry_at = now + retry_delay(status, attempts)
+
+    row.update({
+        'status': status,
+        'attempts': str(attempts),
+        'last_attempt_at': f"{now:.0f}",
+        'next_retry_at': f"{next_retry_at:.0f}" if next_retry_at else '',
+        'message': message,
+    })
+    state[url] = row
+    return next_retry_at
+
+
+def should_skip(row):
+    """判斷該 URL 是否不需要再處理（已完成、永久失敗或重試次數用盡）"""
+    if not row:
+        return False
+    status = row.get('status')
+    if status in DONE_STATUSES or status in PERMANENT_STATUSES:
+        return True
+    return status in TRANSIENT_STATUSES and int(row.get('attempts') or 0) >= MAX_ATTEMPTS
+
+
+def next_retry_time(row):
+    """返回狀態中記錄的下次重試時間（沒有紀錄時返回 0，表示立即處理）"""
+    if not row or not row.get('next_retry_at'):
+        return 0
+    return float(row['next_retry_at'])
+
+
+REVIEW_PAGE_SIZE = 200
+REVIEW_KEEP_VERSIONS = 2
+
+
+def _write_json_atomic(path, data):
+    """先寫入暫存檔再以 os.replace 取代，讀取端不會讀到寫到一半的檔案"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def publish_review_index(csv_filename, index_dir, page_size=REVIEW_PAGE_SIZE):
+    """由連結 CSV 產生審核介面（kolrapp）用的索引
+
+    index_dir/meta.json：總數、已完成數、待處理數與分頁資訊
+    index_dir/<版本>/pending-00000.json：依序分頁的待處理項目 [{index, link}]
+    新版本的資料夾寫完後才替換 meta.json，舊版本只保留最近幾份
+    審核時 kolrapp 的 update-status 會直接修補分頁與 meta.json，不需重新發布
+    """
+    try:
+        source_mtime = os.path.getmtime(csv_filename)
+        with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+            reader = csv.reader(csvfile)
+            headers = next(reader, None)
+            if headers is None:
+                print(f"錯誤：{csv_filename} 為空")
+                return None
+
+            # 列索引與 kolrapp 的 parseCsvRows 相同：略過連結欄為空的行（空白行、只有逗號的行）後從 0 起算
+            total = 0
+            completed = 0
+            pending = []
+            for row in reader:
+                if not row or not row[0].strip():
+                    continue
+                link = row[0].strip()
+                image_done = row[1].strip() if len(row) > 1 else ''
+                if image_done.lower() == 'true':
+                    completed += 1
+                if not image_done:
+                    pending.append({'index': total, 'link': link})
+                total += 1
+
+        os.makedirs(index_dir, exist_ok=True)
+        version = f"v{int(time.time() * 1000)}"
+        version_dir = os.path.join(index_dir, version)
+        os.makedirs(version_dir)
+
+        page_first_index = []
+        page_counts = []
+        for page, start in enumerate(range(0, len(pending), page_size)):
+            records = pending[start:start + page_size]
+            page_first_index.append(records[0]['index'])
+            page_counts.append(len(records))
+            _write_json_atomic(os.path.join(version_dir, f"pending-{page:05d}.json"), records)
+
+        meta = {
+            'version': version,
+            'source': os.path.basename(csv_filename),
+            'source_mtime': source_mtime,
+            'generated_at': time.time(),
+            'total': total,
+            'completed': completed,
+            'pending': len(pending),
+            'page_size': page_size,
+            'pages': len(page_first_index),
+            'page_first_index': page_first_index,
+            'page_counts': page_counts,
+        }
+        _write_json_atomic(os.path.join(index_dir, 'meta.json'), meta)
+
+        # 清除舊版本（保留最近幾份，讓正在讀取的請求不受影響）
+        versions = sorted(
+            name for name in os.listdir(index_dir)
+            if name.startswith('v') and os.path.isdir(os.path.join(index_dir, name))
+        )
+        for name in versions[:-REVIEW_KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(index_dir, name), ignore_errors=True)
+
+        print(f"已發布審核索引 {index_dir}（共 {total} 筆，已完成 {completed} 筆，待處理 {len(pending)} 筆）")
+        return meta
+    except Exception as e:
+        print(f"發布審核索引時發生錯誤: {e}")
+        return None
+
+
+def main():
+    """主函數：為 kolrapp 發布審核索引"""
+    csv_filename = os.path.join('kolrapp', 'public', 'iglink.csv')
+    index_dir = os.path.join('kolrapp', 'public', 'review_index')
+
+    publish_review_index(csv_filename, index_dir)
+
+
+if __name__ == "__main__":
+    main()
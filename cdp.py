@@ -0,0 +1,404 @@
+"""
+DevTools 直連截圖引擎
+Selenium 只負責啟動瀏覽器與登入，之後以 asyncio 直接連到 Chrome 的 DevTools websocket：
+指令可同時送出（pipeline）、以事件得知頁面載入與網路閒置，並在同一個事件迴圈中驅動多個分頁
+需要安裝 websockets 套件：pip install websockets
+"""
+
+import asyncio
+import base64
+import csv
+import io
+import itertools
+import json
+import os
+import time
+import urllib.request
+
+from PIL import Image
+
+try:
+    import websockets
+except ImportError:  # 只有使用這個引擎時才需要
+    websockets = None
+
+from image import PAGE_STATE_SCRIPT, setup_driver, extract_username_from_url, classify_page_content
+from capture_state import (
+    STATUS_TIMEOUT, STATUS_ERROR, STATUS_BAD_CAPTURE, DONE_STATUSES,
+    load_capture_state, save_capture_state, append_capture_state, record_outcome, should_skip,
+    next_retry_time,
+)
+from capture_check import check_capture
+from navigation import navigate
+from workqueue import write_done_to_csv
+
+
+# 截圖高度上限（視窗高度的倍數，與長截圖最多 5 張相同），以及 Chrome 單張截圖的像素上限
+MAX_VIEWPORTS = 5
+MAX_CAPTURE_HEIGHT = 16384
+
+# 網路閒置判定：進行中的請求數不超過 NETWORK_IDLE_MAX_INFLIGHT 並持續 NETWORK_IDLE_SECONDS 秒
+NETWORK_IDLE_MAX_INFLIGHT = 2
+NETWORK_IDLE_SECONDS = 0.5
+
+# 每完成 FLUSH_EVERY 筆或距上次寫回超過 FLUSH_SECONDS 秒，就把截圖狀態與 CSV 寫回檔案
+FLUSH_EVERY = 10
+FLUSH_SECONDS = 30
+
+# 在頁面內一次完成分段滾動（觸發懶加載圖片）並回到頂部
+SCROLL_SCRIPT = """
+(async (height, step) => {
+    for (let y = 0; y < height; y += step) {
+        window.scrollTo(0, y);
+        await new Promise(resolve => setTimeout(resolve, 300));
+    }
+    window.scrollTo(0, 0);
+})(%d, %d)
+"""
+
+
+class CDPError(Exception):
+    """DevTools 指令回傳錯誤或連線中斷"""
+
+
+class CDPConnection:
+    """一條 DevTools websocket 連線，以 sessionId 同時操作多個分頁"""
+
+    def __init__(self, ws):
+        self._ws = ws
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._listeners = []
+        self._reader = None
+
+    @classmethod
+    async def connect(cls, ws_url):
+        if websockets is None:
+            raise RuntimeError("需要安裝 websockets 套件：pip install websockets")
+        ws = await websockets.connect(ws_url, max_size=None)
+        conn = cls(ws)
+        conn._reader = asyncio.create_task(conn._read_loop())
+        return conn
+
+    async def _read_loop(self):
+        try:
+            async for raw in self._ws:
+                message = json.loads(raw)
+                if 'id' in message:
+                    future = self._pending.pop(message['id'], None)
+                    if future is None or future.done():
+                        continue
+                    if 'error' in message:
+                        future.set_exception(CDPError(message['error'].get('message')))
+                    else:
+                        future.set_result(message.get('result', {}))
+                else:
+                    for method, session_id, callback in list(self._listeners):
+                        if method == message.get('method') and session_id == message.get('sessionId'):
+                            callback(message.get('params', {}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(CDPError("DevTools 連線已關閉"))
+            self._pending.clear()
+
+    async def send(self, method, params=None, session_id=None, timeout=30):
+        """送出指令並等待結果；多個 send 可用 asyncio.gather 同時送出"""
+        message_id = next(self._ids)
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        future = asyncio.get_running_loop().create_future()
+        self._pending[message_id] = future
+        await self._ws.send(json.dumps(message))
+        return await asyncio.wait_for(future, timeout)
+
+    def on(self, method, callback, session_id=None):
+        """訂閱事件，返回可傳給 off 的識別"""
+        listener = (method, session_id, callback)
+        self._listeners.append(listener)
+        return listener
+
+    def off(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def wait_for(self, method, session_id=None):
+        """返回下一次事件發生時完成的 future（須在觸發事件的指令之前呼叫）"""
+        future = asyncio.get_running_loop().create_future()
+
+        def callback(params):
+            if not future.done():
+                future.set_result(params)
+            self.off(listener)
+
+        listener = self.on(method, callback, session_id)
+        return future
+
+    async def close(self):
+        if self._reader:
+            self._reader.cancel()
+        await self._ws.close()
+
+
+def browser_ws_url(driver):
+    """由 Selenium 啟動的 Chrome 取得瀏覽器層級的 DevTools websocket 網址"""
+    address = driver.capabilities['goog:chromeOptions']['debuggerAddress']
+    with urllib.request.urlopen(f"http://{address}/json/version", timeout=10) as response:
+        return json.loads(response.read().decode('utf-8'))['webSocketDebuggerUrl']
+
+
+def track_network(conn, session_id):
+    """開始追蹤分頁的進行中請求，返回追蹤狀態（以 stop_tracking 結束）"""
+    tracker = {'inflight': set(), 'last_change': time.monotonic(), 'listeners': []}
+
+    def started(params):
+        tracker['inflight'].add(params.get('requestId'))
+        tracker['last_change'] = time.monotonic()
+
+    def finished(params):
+        tracker['inflight'].discard(params.get('requestId'))
+        tracker['last_change'] = time.monotonic()
+
+    tracker['listeners'] = [
+        conn.on('Network.requestWillBeSent', started, session_id),
+        conn.on('Network.loadingFinished', finished, session_id),
+        conn.on('Network.loadingFailed', finished, session_id),
+    ]
+    return tracker
+
+
+def stop_tracking(conn, tracker):
+    for listener in tracker['listeners']:
+        conn.off(listener)
+
+
+async def wait_network_idle(tracker, timeout=15):
+    """等待網路閒置，超過 timeout 秒仍未閒置時直接返回 False"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        idle_for = time.monotonic() - tracker['last_change']
+        if len(tracker['inflight']) <= NETWORK_IDLE_MAX_INFLIGHT and idle_for >= NETWORK_IDLE_SECONDS:
+            return True
+        await asyncio.sleep(0.1)
+    return False
+
+
+async def open_tab(conn):
+    """開啟新分頁並附加 session，返回 (targetId, sessionId)"""
+    target = await conn.send('Target.createTarget', {'url': 'about:blank'})
+    attached = await conn.send('Target.attachToTarget', {'targetId': target['targetId'], 'flatten': True})
+    return target['targetId'], attached['sessionId']
+
+
+async def capture_page(conn, session_id, url, save_path, timeout=30):
+    """在分頁中開啟個人檔案頁面，判斷結果分類後整頁截圖，返回結果分類"""
+    # 同時送出啟用指令
+    await asyncio.gather(
+        conn.send('Page.enable', session_id=session_id),
+        conn.send('Network.enable', session_id=session_id),
+    )
+    tracker = track_network(conn, session_id)
+    try:
+        loaded = conn.wait_for('Page.loadEventFired', session_id)
+        navigation = await conn.send('Page.navigate', {'url': url}, session_id, timeout)
+        if navigation.get('errorText'):
+            print(f"頁面載入失敗: {navigation['errorText']}")
+            return STATUS_ERROR
+        try:
+            await asyncio.wait_for(loaded, timeout)
+        except asyncio.TimeoutError:
+            # 載入事件逾時仍繼續判斷：頁面主要內容可能已可使用
+            print(f"等待載入事件逾時: {url}")
+        await wait_network_idle(tracker)
+
+        evaluated = await conn.send('Runtime.evaluate', {
+            'expression': f"(() => {{{PAGE_STATE_SCRIPT}}})()",
+            'returnByValue': True,
+        }, session_id)
+        status = classify_page_content(evaluated.get('result', {}).get('value') or {})
+        if status not in DONE_STATUSES:
+            print(f"頁面狀態為 {status}，不進行截圖: {url}")
+            return status
+
+        # 在頁面內滾動一次觸發懶加載，再等待網路閒置
+        metrics = await conn.send('Page.getLayoutMetrics', session_id=session_id)
+        viewport = metrics['cssLayoutViewport']
+        content = metrics['cssContentSize']
+        height = min(content['height'], viewport['clientHeight'] * MAX_VIEWPORTS, MAX_CAPTURE_HEIGHT)
+        await conn.send('Runtime.evaluate', {
+            'expression': SCROLL_SCRIPT % (height, int(viewport['clientHeight'] * 0.9)),
+            'awaitPromise': True,
+        }, session_id, timeout)
+        await wait_network_idle(tracker, timeout=5)
+
+        # 單一指令取得整頁截圖，不需要逐張滾動拼接
+        shot = await conn.send('Page.captureScreenshot', {
+            'format': 'png',
+            'captureBeyondViewport': True,
+            'clip': {'x': 0, 'y': 0, 'width': viewport['clientWidth'], 'height': height, 'scale': 1},
+        }, session_id, timeout)
+    finally:
+        stop_tracking(conn, tracker)
+
+    # 解碼、存檔與品質檢查都是 CPU / 磁碟工作，移到執行緒中進行，不阻塞其他分頁
+    problems, scores = await asyncio.to_thread(save_and_check, shot['data'], save_path)
+    if problems:
+        print(f"截圖品質不佳: {problems} {scores}")
+        return STATUS_BAD_CAPTURE
+    print(f"截圖已儲存: {save_path}")
+    return status
+
+
+def save_and_check(data, save_path):
+    """以記憶體中的圖片檢查 base64 截圖，通過檢查才寫入檔案（不覆蓋先前的正常截圖），返回 (問題列表, 分數)"""
+    png = base64.b64decode(data)
+    problems, scores = check_capture(Image.open(io.BytesIO(png)))
+    if not problems:
+        with open(save_path, 'wb') as f:
+            f.write(png)
+    return problems, scores
+
+
+async def capture_many(ws_url, items, image_folder, concurrency=4, timeout=30, on_result=None):
+    """以同一條連線、同一個事件迴圈同時驅動 concurrency 個分頁截圖
+
+    items 為 (url, username) 列表；每完成一筆就呼叫 on_result(url, status)，
+    on_result 可以是 async 函數（會等待它完成）
+    """
+    conn = await CDPConnection.connect(ws_url)
+    semaphore = asyncio.Semaphore(concurrency)
+    results = {}
+
+    async def run(url, username):
+        async with semaphore:
+            target_id = None
+            try:
+                target_id, session_id = await open_tab(conn)
+                save_path = os.path.join(image_folder, f"{username}.png")
+                status = await capture_page(conn, session_id, url, save_path, timeout)
+            except asyncio.TimeoutError:
+                status = STATUS_TIMEOUT
+            except Exception as e:
+                print(f"處理 {url} 時發生錯誤: {e}")
+                status = STATUS_ERROR
+            finally:
+                if target_id:
+                    try:
+                        await conn.send('Target.closeTarget', {'targetId': target_id})
+                    except Exception:
+                        pass
+            results[url] = status
+            if on_result:
+                outcome = on_result(url, status)
+                if asyncio.iscoroutine(outcome):
+                    await outcome
+
+    try:
+        await asyncio.gather(*(run(url, username) for url, username in items))
+    finally:
+        await conn.close()
+    return results
+
+
+def screenshot_with_cdp(csv_filename='link.csv', image_folder='image', concurrency=4,
+                        state_filename='capture_state.csv', login_wait=120):
+    """以 DevTools 直連引擎處理 CSV 中未完成的 URL（Selenium 只用於啟動瀏覽器與登入）"""
+    os.makedirs(image_folder, exist_ok=True)
+    state = load_capture_state(state_filename)
+
+    items = []
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # 跳過標題行
+        for row in reader:
+            if not row or not row[0].strip():
+                continue
+            url = row[0].strip().strip('"')
+            image_done = row[1].strip().strip('"').lower() if len(row) > 1 else ""
+            if image_done == "true" or should_skip(state.get(url)):
+                continue
+            # 還在退避時間內的重試留待下次執行
+            if next_retry_time(state.get(url)) > time.time():
+                continue
+            username = extract_username_from_url(url)
+            if username:
+                items.append((url, username))
+
+    print(f"待處理: {len(items)} 筆，同時開啟 {concurrency} 個分頁")
+    if not items:
+        return {}
+
+    driver = setup_driver()
+    status_counts = {}
+    done_urls = set()      # 尚未寫回 CSV 的已完成 URL
+    changed_urls = set()   # 尚未寫入狀態檔的 URL
+    flush_state = {'unsaved': 0, 'saved_at': time.time()}
+
+    def flush(state_rows, urls):
+        append_capture_state(state_filename, state_rows)
+        write_done_to_csv(csv_filename, urls)
+
+    async def on_result(url, status):
+        status_counts[status] = status_counts.get(status, 0) + 1
+        record_outcome(state, url, status)
+        changed_urls.add(url)
+        if status in DONE_STATUSES:
+            done_urls.add(url)
+        print(f"[{sum(status_counts.values())}/{len(items)}] {status}: {url}")
+
+        # 分批寫回，程式被強制結束時最多只損失一批結果；寫檔在執行緒中進行，不阻塞其他分頁
+        flush_state['unsaved'] += 1
+        if (flush_state['unsaved'] < FLUSH_EVERY
+                and time.time() - flush_state['saved_at'] < FLUSH_SECONDS):
+            return
+        snapshot = [dict(state[key]) for key in changed_urls]
+        urls = set(done_urls)
+        changed_urls.clear()
+        done_urls.clear()
+        flush_state.update(unsaved=0, saved_at=time.time())
+        async with flush_lock:
+            await asyncio.to_thread(flush, snapshot, urls)
+
+    async def run_capture():
+        # asyncio.Lock 需在事件迴圈內建立
+        nonlocal flush_lock
+        flush_lock = asyncio.Lock()
+        return await capture_many(browser_ws_url(driver), items, image_folder,
+                                  concurrency, on_result=on_result)
+
+    flush_lock = None
+
+    try:
+        navigate(driver, "https://www.instagram.com/")
+        print(f"\n請在 {login_wait} 秒內手動登入 Instagram...")
+        time.sleep(login_wait)
+
+        started_at = time.time()
+        results = asyncio.run(run_capture())
+        elapsed = time.time() - started_at
+        print(f"\n完成 {len(results)} 筆，耗時 {elapsed:.0f} 秒（每筆 {elapsed / max(len(results), 1):.1f} 秒）")
+        print(f"結果分類: {status_counts}")
+        return results
+    finally:
+        # 結束時整份重寫狀態檔，合併執行中附加的列
+        save_capture_state(state_filename, state)
+        write_done_to_csv(csv_filename, done_urls)
+        driver.quit()
+        print("瀏覽器已關閉")
+
+
+def main():
+    """主函數"""
+    csv_filename = 'link.csv'
+    image_folder = 'image'
+    concurrency = 4
+
+    print("開始 Instagram 頁面截圖任務（DevTools 直連）...")
+    screenshot_with_cdp(csv_filename, image_folder, concurrency)
+
+
+if __name__ == "__main__":
+    main()
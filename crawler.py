@@ -14,11 +14,21 @@ import time
 import csv
 import os
 import re
-from urllib.parse import urlparse
+from urllib.parse import urlparse, urlunparse, parse_qs, urlencode
+import glob
+import weakref
 
+from replay import record_snapshot
+from navigation import PAGE_LOAD_STRATEGY, NAVIGATION_DEADLINE, set_page_load_strategy, navigate
+from scheduler import format_eta
 
-def setup_driver():
-    """設定 Chrome WebDriver"""
+
+# 搜尋結果頁可用的判斷：出現帶有 data-sns-link 的帳號連結
+SEARCH_READY_SELECTOR = "[data-sns-link]"
+
+
+def setup_driver(page_load_strategy=PAGE_LOAD_STRATEGY, proxy=None):
+    """設定 Chrome WebDriver（載入策略見 navigation.py，proxy 為代理位址）"""
     chrome_options = Options()
     # 取消註解下面這行可以讓瀏覽器在背景執行（無頭模式）
     # chrome_options.add_argument('--headless')
@@ -33,20 +43,27 @@ def setup_driver():
         "user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     )
 
+    if proxy:
+        chrome_options.add_argument(f"--proxy-server={proxy}")
+    set_page_load_strategy(chrome_options, page_load_strategy)
+
     # 使用 webdriver-manager 自動管理 ChromeDriver
     service = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=chrome_options)
+    driver.set_page_load_timeout(NAVIGATION_DEADLINE)
     return driver
 
 
-def open_page(url, driver=None):
-    """開啟指定的網頁"""
+def open_page(url, driver=None, deadline=NAVIGATION_DEADLINE):
+    """開啟指定的網頁（每次載入最多等待 deadline 秒，逾時會停止載入並重試）"""
     if driver is None:
         driver = setup_driver()
+    # 不同的搜尋條件頁碼與總頁數都不同，重新開啟頁面時清除這個瀏覽器的快取
+    _page_info_cache.pop(driver, None)
 
     try:
         print(f"\n正在開啟頁面: {url}")
-        driver.get(url)
+        navigate(driver, url, deadline=deadline)
 
         # 等待使用者手動登入
         print("請在 30 秒內手動登入...")
@@ -54,10 +71,9 @@ def open_page(url, driver=None):
 
         # 手動登入後再重新進入 url
         print("再次載入頁面...")
-        driver.get(url)
-
         print("等待頁面載入...")
-        time.sleep(2)  # 給頁面一些時間載入
+        if not navigate(driver, url, SEARCH_READY_SELECTOR, deadline):
+            print(f"頁面在 {deadline} 秒內未出現搜尋結果，繼續嘗試抓取")
 
         print(f"頁面標題: {driver.title}")
         print(f"當前 URL: {driver.current_url}")
@@ -71,34 +87,73 @@ def open_page(url, driver=None):
         return None
 
 
+# 搜尋結果頁的抽取規格，線上抓取與 replay.py 的離線重播共用同一份設定
+# 每頁最多 LINK_SLOTS 筆，第 i 筆連結是 LINK_SLOT_XPATH.format(slot=i) 的 LINK_ATTRIBUTE 屬性
+LINK_SLOT_XPATH = '//*[@id="__next"]/div[1]/main/div/div/div[2]/main/div[2]/div[3]/div/div[1]/div/div/div/div[{slot}]/a'
+LINK_SLOTS = 12
+LINK_ATTRIBUTE = "data-sns-link"
+
+# 頁碼資訊的格式（例如：2 / 796 頁），同時傳給瀏覽器端的 PAGE_INFO_SCRIPT 使用
+PAGE_INFO_PATTERN = re.compile(r"(\d+)\s*/\s*(\d+)\s*頁")
+
+# 頁碼資訊的候選選擇器，成功的選擇器會被快取並優先使用
+PAGE_INFO_SELECTORS = [
+    "div.pagination_Wrapper-sc-1352b46e-1.bwXAuy span",
+    "div[class*='pagination_Wrapper'] span",
+]
+# 每個瀏覽器各自快取成功的選擇器與總頁數，瀏覽器關閉後自動釋放
+_page_info_cache = weakref.WeakKeyDictionary()
+
+
+def page_info_cache(driver):
+    """取得指定瀏覽器的頁碼快取"""
+    return _page_info_cache.setdefault(driver, {"selector": None, "total_pages": None})
+
+# 在瀏覽器端一次完成頁碼搜尋：先試候選選擇器，都找不到時才走訪整頁文字節點
+PAGE_INFO_SCRIPT = """
+    const pattern = new RegExp(arguments[1]);
+    for (const selector of arguments[0]) {
+        for (const el of document.querySelectorAll(selector)) {
+            const match = pattern.exec(el.textContent);
+            if (match) return [parseInt(match[1]), parseInt(match[2]), selector];
+        }
+    }
+    const walker = document.createTreeWalker(document.body, NodeFilter.SHOW_TEXT);
+    let node;
+    while ((node = walker.nextNode())) {
+        if (!node.textContent.includes('頁')) continue;
+        const el = node.parentElement;
+        const match = el && pattern.exec(el.textContent);
+        if (!match) continue;
+        // 以父元素的 class 組出選擇器，供下次直接使用
+        let selector = null;
+        const parent = el.parentElement;
+        if (parent && parent.classList.length) {
+            selector = parent.tagName.toLowerCase() + '.' +
+                Array.from(parent.classList).map(c => CSS.escape(c)).join('.') +
+                ' > ' + el.tagName.toLowerCase();
+        }
+        return [parseInt(match[1]), parseInt(match[2]), selector];
+    }
+    return null;
+"""
+
+
 def get_page_info(driver):
     """獲取當前頁碼和總頁碼，返回 (current_page, total_pages)"""
+    cache = page_info_cache(driver)
     try:
-        # 尋找包含頁碼資訊的 span 元素（格式：2 / 796 頁）
-        # 這個 span 在 pagination_Wrapper-sc-1352b46e-1 bwXAuy 容器內
-        page_info_elements = driver.find_elements(
-            By.CSS_SELECTOR, "div.pagination_Wrapper-sc-1352b46e-1.bwXAuy span"
-        )
-
-        for element in page_info_elements:
-            text = element.text.strip()
-            # 匹配格式：數字 / 數字 頁
-            match = re.search(r"(\d+)\s*/\s*(\d+)\s*頁", text)
-            if match:
-                current_page = int(match.group(1))
-                total_pages = int(match.group(2))
-                return current_page, total_pages
-
-        # 如果找不到，嘗試其他可能的位置
-        # 直接搜尋包含 "/" 和 "頁" 的文字
-        all_spans = driver.find_elements(By.TAG_NAME, "span")
-        for span in all_spans:
-            text = span.text.strip()
-            match = re.search(r"(\d+)\s*/\s*(\d+)\s*頁", text)
-            if match:
-                current_page = int(match.group(1))
-                total_pages = int(match.group(2))
-                return current_page, total_pages
+        selectors = list(PAGE_INFO_SELECTORS)
+        if cache["selector"]:
+            selectors.insert(0, cache["selector"])
+
+        result = driver.execute_script(PAGE_INFO_SCRIPT, selectors, PAGE_INFO_PATTERN.pattern)
+        if result:
+            current_page, total_pages, selector = result
+            if selector and selector != cache["selector"]:
+                cache["selector"] = selector
+            cache["total_pages"] = total_pages
+            return current_page, total_pages
 
         print("警告：無法找到頁碼資訊")
         return None, None
@@ -107,6 +162,14 @@ def get_page_info(driver):
         return None, None
 
 
+def probe_total_pages(driver):
+    """取得總頁數（已知時直接使用快取），供預估工作量與剩餘時間"""
+    cache = page_info_cache(driver)
+    if cache["total_pages"] is None:
+        get_page_info(driver)
+    return cache["total_pages"]
+
+
 def click_next_button(driver, max_wait_time=30):
     """點擊下一頁按鈕，返回是否成功。會等待按鈕可點擊（頁面載入完畢）"""
     try:
@@ -194,43 +257,38 @@ def click_next_button(driver, max_wait_time=30):
         return False
 
 
-def scrape_and_save_links(driver, csv_filename="link.csv"):
-    """抓取當前頁面的連結並寫入 CSV，如果無法抓取則重試（最多5次）"""
-    file_exists = os.path.exists(csv_filename)
-    max_retries = 10
+def collect_slot_links(get_attribute):
+    """依 LINK_SLOT_XPATH 逐一讀取每個位置的連結，返回連結列表
 
-    # 重試機制：如果無法抓取資料，等待1秒後重試，最多5次
+    get_attribute(xpath, 屬性名稱) 在找不到元素時拋出例外；線上由 WebDriver 提供，
+    離線重播時由快照的元素樹提供
+    """
+    links = []
+    for slot in range(1, LINK_SLOTS + 1):
+        try:
+            link = get_attribute(LINK_SLOT_XPATH.format(slot=slot), LINK_ATTRIBUTE)
+        except Exception:
+            # 如果找不到該位置的元素，可能是最後一頁（少於12筆），繼續下一個
+            continue
+        if link:  # 確保連結不為空
+            links.append(link)
+    return links
+
+
+def collect_page_links(driver, max_retries=10):
+    """抓取當前頁面的連結（每頁最多12筆），如果無法抓取則重試，返回連結列表"""
+    # 重試機制：如果無法抓取資料，等待1秒後重試
     for retry_count in range(max_retries):
         try:
             # 抓取當前頁面的連結（每頁最多12筆）
-            sns_links = []
-            base_xpath = "//*[@id=\"__next\"]/div[1]/main/div/div/div[2]/main/div[2]/div[3]/div/div[1]/div/div/div/div"
-            
-            for i in range(1, 13):  # 從 div[1] 到 div[12]
-                try:
-                    xpath = f"{base_xpath}[{i}]/a"
-                    element = driver.find_element(By.XPATH, xpath)
-                    link = element.get_attribute("data-sns-link")
-                    if link:  # 確保連結不為空
-                        sns_links.append(link)
-                except:
-                    # 如果找不到該位置的元素，可能是最後一頁（少於12筆），繼續下一個
-                    continue
+            sns_links = collect_slot_links(
+                lambda xpath, name: driver.find_element(By.XPATH, xpath).get_attribute(name)
+            )
 
-            # 如果成功抓到連結，處理並返回
+            # 如果成功抓到連結，返回
             if sns_links and len(sns_links) > 0:
                 print(f"\n當前頁面抓取到 {len(sns_links)} 個連結")
-
-                write_header = not file_exists  # 若檔案不存在要寫 header
-                with open(csv_filename, "a", newline="", encoding="utf-8") as csvfile:
-                    writer = csv.writer(csvfile)
-                    if write_header:
-                        writer.writerow(["link", "image_done"])
-                    for link in sns_links:
-                        if link:  # 確保連結不為空
-                            writer.writerow([link, ""])  # image_done 預設空字串
-                print(f"已寫入 {len(sns_links)} 筆連結到 {csv_filename}")
-                return len(sns_links)
+                return sns_links
             else:
                 # 如果沒有抓到連結，且還有重試機會，則等待後重試
                 if retry_count < max_retries - 1:
@@ -240,7 +298,7 @@ def scrape_and_save_links(driver, csv_filename="link.csv"):
                     time.sleep(1)
                 else:
                     print("無法抓取到連結，已達最大重試次數")
-                    return 0
+                    return []
 
         except Exception as e:
             # 如果發生錯誤，且還有重試機會，則等待後重試
@@ -251,9 +309,64 @@ def scrape_and_save_links(driver, csv_filename="link.csv"):
                 time.sleep(1)
             else:
                 print(f"抓取連結時發生錯誤，已達最大重試次數: {e}")
-                return 0
+                return []
+
+    return []
+
+
+def save_links(csv_filename, links):
+    """將連結附加寫入 CSV，返回寫入筆數"""
+    if not links:
+        return 0
+
+    write_header = not os.path.exists(csv_filename)  # 若檔案不存在要寫 header
+    with open(csv_filename, "a", newline="", encoding="utf-8") as csvfile:
+        writer = csv.writer(csvfile)
+        if write_header:
+            writer.writerow(["link", "image_done"])
+        for link in links:
+            if link:  # 確保連結不為空
+                writer.writerow([link, ""])  # image_done 預設空字串
+    print(f"已寫入 {len(links)} 筆連結到 {csv_filename}")
+    return len(links)
+
+
+def scrape_and_save_links(driver, csv_filename="link.csv"):
+    """抓取當前頁面的連結並寫入 CSV，如果無法抓取則重試（最多10次）"""
+    return save_links(csv_filename, collect_page_links(driver))
+
+
+def link_key(link):
+    """連結比對用的鍵值（帳號名稱小寫），無法解析時使用去除斜線的連結"""
+    username = extract_username_from_url(link)
+    return username.lower() if username else link.strip().rstrip("/").lower()
+
+
+def load_known_links(pattern="link*.csv"):
+    """讀取符合 pattern 的所有連結 CSV，返回已知帳號的鍵值集合"""
+    known = set()
+    for filename in sorted(glob.glob(pattern)):
+        try:
+            with open(filename, "r", newline="", encoding="utf-8") as csvfile:
+                reader = csv.reader(csvfile)
+                next(reader, None)  # 跳過標題行
+                for row in reader:
+                    if row and row[0].strip():
+                        known.add(link_key(row[0].strip().strip('"')))
+        except Exception as e:
+            print(f"讀取 {filename} 時發生錯誤: {e}")
+    print(f"已載入 {len(known)} 個已知帳號")
+    return known
 
-    return 0
+
+def ensure_stable_sort(url, sort="followerCount"):
+    """確保搜尋 URL 帶有固定的排序參數，讓每次增量爬取的頁面順序一致"""
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query, keep_blank_values=True)
+    if query.get("sort"):
+        return url
+    query["sort"] = [sort]
+    return urlunparse(parsed._replace(query=urlencode(query, doseq=True)))
 
 
 def extract_username_from_url(url):
@@ -461,8 +574,10 @@ def screenshot_instagram_pages(
                 try:
                     # 開啟頁面
                     print(f"正在開啟頁面...")
-                    driver.get(url)
-                    time.sleep(5)  # 等待頁面載入
+                    if not navigate(driver, url, 'main header'):
+                        print(f"頁面載入逾時，跳過")
+                        error_count += 1
+                        continue
 
                     # 進行長截圖
                     image_path = os.path.join(image_folder, f"{username}.png")
@@ -508,25 +623,56 @@ def screenshot_instagram_pages(
             print("瀏覽器已關閉")
 
 
-def main():
-    """主函數"""
-    url = "https://app.kolr.ai/search?country_code=tw&filter_kol_type=all&follower_end_to=15999&follower_start_from=15000&gender=Female&mode=kol&platform_type=ig&sort=followerCount"
-    csv_filename = "link.csv"
-    max_pages = 1000  # 安全上限，防止無限循環（通常不會達到）
+def harvest_links(
+    url,
+    csv_filename="link.csv",
+    max_pages=1000,
+    record_dir=None,
+    incremental=False,
+    known_pattern="link*.csv",
+    stop_after_known_pages=None,
+    stop_event=None,
+):
+    """逐頁爬取搜尋結果的連結並寫入 CSV，完整爬完時返回 True
+
+    incremental 為 True 時只寫入不在 known_pattern 檔案中的新帳號，仍會走完所有頁面：
+    搜尋結果依粉絲數排序，新帳號會穿插在已知帳號之間，前幾頁都是已知帳號不代表後面沒有新帳號
+    設定 stop_after_known_pages 時，連續這麼多頁都沒有新帳號就提前結束（可能漏掉新帳號，返回 False）
+    stop_event（threading.Event）被設定時，在處理下一頁之前停止
+    """
+    known_links = None
+    if incremental:
+        url = ensure_stable_sort(url)
+        known_links = load_known_links(known_pattern)
 
     driver = open_page(url)
 
     if not driver:
         print("無法初始化瀏覽器")
-        return
+        return False
 
+    # 只有到達最後一頁或達到頁數上限才算完整爬完；增量模式提前結束、
+    # 點擊下一頁失敗、讀不到頁碼或被中斷時返回 False，之後可從中斷處繼續
+    completed = False
     try:
         page_count = 0
         total_saved = 0
         is_last_page = False
+        known_page_streak = 0  # 連續只有已知帳號的頁數
+
+        # 先取得總頁數，預估本次需要處理的頁數
+        total_pages = probe_total_pages(driver)
+        planned_pages = min(total_pages, max_pages) if total_pages else max_pages
+        if total_pages:
+            print(f"總頁數：{total_pages}，預計處理 {planned_pages} 頁")
+        start_time = time.time()
 
         # 使用無限迴圈，基於頁碼檢測來結束
         while True:
+            if stop_event is not None and stop_event.is_set():
+                print(f"\n收到停止要求，已處理 {page_count} 頁，結束爬取")
+                break
+
             page_count += 1
             print(f"\n{'='*50}")
             print(f"正在處理第 {page_count} 頁")
@@ -545,18 +691,45 @@ def main():
                     is_last_page = True
                     print(f"已到達最後一頁（{current_page} / {total_pages}）")
 
+            # 錄製模式：保存搜尋頁快照
+            if record_dir:
+                record_snapshot(driver, record_dir, "search", f"page_{current_page or page_count:04d}")
+
             # 抓取並保存連結
-            saved_count = scrape_and_save_links(driver, csv_filename)
+            if known_links is None:
+                saved_count = scrape_and_save_links(driver, csv_filename)
+            else:
+                page_links = collect_page_links(driver)
+                new_links = []
+                for link in page_links:
+                    key = link_key(link)
+                    if key not in known_links:
+                        known_links.add(key)
+                        new_links.append(link)
+                saved_count = save_links(csv_filename, new_links)
+                print(f"本頁新帳號 {len(new_links)} 筆，已知帳號 {len(page_links) - len(new_links)} 筆")
+
+                if page_links and not new_links:
+                    known_page_streak += 1
+                else:
+                    known_page_streak = 0
             total_saved += saved_count
 
+            # 增量模式提前結束：後面的頁面仍可能有新帳號，不算完整爬完
+            if incremental and stop_after_known_pages and known_page_streak >= stop_after_known_pages:
+                print(f"\n連續 {known_page_streak} 頁都是已知帳號，提前結束增量爬取（未走完所有頁面）")
+                break
+
             # 如果是最後一頁，抓取完資料後結束
             if is_last_page:
                 print(f"\n已到達最後一頁並完成資料抓取，結束爬取")
+                completed = True
                 break
 
             # 安全檢查：防止無限循環（如果無法獲取頁碼資訊）
             if page_count >= max_pages:
                 print(f"\n達到安全上限（{max_pages} 頁），結束爬取")
+                completed = True
                 break
 
             # 嘗試點擊下一頁（會等待按鈕可點擊，確保頁面載入完畢）
@@ -568,6 +741,7 @@ def main():
                         print(
                             f"\n確認已到達最後一頁（{current_page_check} / {total_pages_check}），結束爬取"
                         )
+                        completed = True
                         break
                     else:
                         print(
@@ -587,8 +761,13 @@ def main():
             print("等待新頁面載入...")
             time.sleep(3)
 
-            # 可選：顯示進度
+            # 顯示進度與預估剩餘時間
             print(f"目前總共已保存 {total_saved} 筆連結")
+            if current_page is not None and total_pages is not None:
+                planned_pages = min(total_pages, max_pages)
+                remaining_pages = max(min(total_pages - current_page, planned_pages - page_count), 0)
+                seconds_per_page = (time.time() - start_time) / page_count
+                print(f"每頁平均 {seconds_per_page:.1f} 秒，預估剩餘 {remaining_pages} 頁，約 {format_eta(remaining_pages * seconds_per_page)}")
 
         print(f"\n{'='*50}")
         print(f"爬蟲執行完成！")
@@ -604,6 +783,18 @@ def main():
         if driver:
             driver.quit()
             print("瀏覽器已關閉")
+    return completed
+
+
+def main():
+    """主函數"""
+    url = "https://app.kolr.ai/search?country_code=tw&filter_kol_type=all&follower_end_to=15999&follower_start_from=15000&gender=Female&mode=kol&platform_type=ig&sort=followerCount"
+    csv_filename = "link.csv"
+    max_pages = 1000  # 安全上限，防止無限循環（通常不會達到）
+    record_dir = None  # 設定資料夾路徑（例如 "snapshots"）即可錄製每頁 HTML 快照供離線重播
+    incremental = False  # 設為 True 只寫入新帳號（仍會走完所有頁面）
+
+    harvest_links(url, csv_filename, max_pages, record_dir, incremental)
 
 
 def screenshot_main():
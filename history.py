@@ -0,0 +1,180 @@
+"""
+截圖歷史紀錄
+為每個帳號保存截圖時間軸：關鍵版本存完整 PNG，之後的版本只存與前一版不同的區塊
+（壓縮後的 npz），並以 index.csv 快速查詢某時間之後有變化的帳號；
+每個帳號的資料夾另有自己的 index.csv，加入新版本時只需讀取該帳號的紀錄
+"""
+
+import csv
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+
+HISTORY_INDEX = 'index.csv'
+INDEX_FIELDS = ['username', 'version', 'captured_at', 'kind', 'changed_ratio', 'file']
+
+# 版本種類：完整圖（key）、差異區塊（delta）、與前一版相同（same）
+KIND_KEY = 'key'
+KIND_DELTA = 'delta'
+KIND_SAME = 'same'
+
+TILE_SIZE = 32
+KEYFRAME_INTERVAL = 10      # 連續幾個差異版本後強制存一次完整圖，限制還原時需套用的差異數量
+KEYFRAME_CHANGED_RATIO = 0.5  # 變化區塊比例超過此值時直接存完整圖
+
+
+def load_history_index(history_dir, username=None):
+    """讀取歷史索引，返回索引列列表（可只取某個帳號，只讀取該帳號自己的索引）"""
+    index_path = os.path.join(history_dir, HISTORY_INDEX)
+    if username is not None:
+        user_index_path = os.path.join(history_dir, username, HISTORY_INDEX)
+        # 舊版的歷史紀錄只有共用索引，沒有帳號索引時改讀共用索引
+        if os.path.exists(user_index_path):
+            index_path = user_index_path
+    if not os.path.exists(index_path):
+        return []
+    with open(index_path, 'r', newline='', encoding='utf-8') as csvfile:
+        rows = [row for row in csv.DictReader(csvfile)
+                if username is None or row['username'] == username]
+    for row in rows:
+        row['version'] = int(row['version'])
+        row['captured_at'] = float(row['captured_at'])
+        row['changed_ratio'] = float(row['changed_ratio'])
+    return rows
+
+
+def _append_rows(index_path, rows):
+    write_header = not os.path.exists(index_path)
+    with open(index_path, 'a', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=INDEX_FIELDS)
+        if write_header:
+            writer.writeheader()
+        writer.writerows(rows)
+
+
+def _append_index(history_dir, entry, previous_rows):
+    """將索引列附加到共用索引與帳號索引（帳號索引不存在時先補上先前的紀錄）"""
+    _append_rows(os.path.join(history_dir, HISTORY_INDEX), [entry])
+    user_index_path = os.path.join(history_dir, entry['username'], HISTORY_INDEX)
+    if not os.path.exists(user_index_path):
+        _append_rows(user_index_path, previous_rows)
+    _append_rows(user_index_path, [entry])
+
+
+def _to_tiles(array):
+    """將 H×W×3 陣列補齊到區塊大小的倍數，返回 (rows, cols, TILE, TILE, 3) 的區塊陣列"""
+    height, width = array.shape[:2]
+    pad_h = -height % TILE_SIZE
+    pad_w = -width % TILE_SIZE
+    if pad_h or pad_w:
+        array = np.pad(array, ((0, pad_h), (0, pad_w), (0, 0)))
+    rows, cols = array.shape[0] // TILE_SIZE, array.shape[1] // TILE_SIZE
+    return array.reshape(rows, TILE_SIZE, cols, TILE_SIZE, 3).swapaxes(1, 2)
+
+
+def _from_tiles(tiles, height, width):
+    """將區塊陣列組回 H×W×3 陣列"""
+    rows, cols = tiles.shape[:2]
+    return tiles.swapaxes(1, 2).reshape(rows * TILE_SIZE, cols * TILE_SIZE, 3)[:height, :width]
+
+
+def load_version(history_dir, username, version=None):
+    """還原指定版本（預設為最新版）的截圖，返回 PIL 圖片，找不到時返回 None"""
+    rows = load_history_index(history_dir, username)
+    if version is not None:
+        rows = [row for row in rows if row['version'] <= version]
+    if not rows:
+        return None
+    return Image.fromarray(_restore(os.path.join(history_dir, username), rows))
+
+
+def _restore(folder, rows):
+    """依索引列還原最後一個版本，返回 H×W×3 陣列"""
+    # 從最近的完整圖開始依序套用差異
+    start = max(i for i, row in enumerate(rows) if row['kind'] == KIND_KEY)
+    with Image.open(os.path.join(folder, rows[start]['file'])) as key_image:
+        array = np.array(key_image.convert('RGB'))
+
+    for row in rows[start + 1:]:
+        if row['kind'] != KIND_DELTA:
+            continue
+        with np.load(os.path.join(folder, row['file'])) as delta:
+            tiles = _to_tiles(array).copy()
+            coords = delta['coords']
+            tiles[coords[:, 0], coords[:, 1]] = delta['tiles']
+            array = _from_tiles(tiles, array.shape[0], array.shape[1])
+    return array
+
+
+def add_capture(history_dir, username, image, captured_at=None):
+    """將新截圖加入帳號的時間軸，返回索引列（image 可為路徑或 PIL 圖片）"""
+    captured_at = captured_at or time.time()
+    if not isinstance(image, Image.Image):
+        with Image.open(image) as opened:
+            image = opened.convert('RGB')
+    current = np.array(image.convert('RGB'))
+
+    folder = os.path.join(history_dir, username)
+    os.makedirs(folder, exist_ok=True)
+    rows = load_history_index(history_dir, username)
+    version = rows[-1]['version'] + 1 if rows else 1
+
+    kind = KIND_KEY
+    changed_ratio = 1.0
+    coords = None
+    if rows:
+        previous = _restore(folder, rows)
+        if previous.shape == current.shape:
+            # 區塊內任一像素不同就視為有變化，還原時才能得到與原圖完全相同的圖片
+            # （強制存完整圖時也記錄實際的變化比例）
+            changed = (_to_tiles(current) != _to_tiles(previous)).any(axis=(2, 3, 4))
+            changed_ratio = float(changed.mean())
+            coords = np.argwhere(changed)
+
+            # 只有差異版本會增加還原時的負擔，相同的版本不計入間隔
+            last_key = max(i for i, row in enumerate(rows) if row['kind'] == KIND_KEY)
+            deltas = sum(1 for row in rows[last_key + 1:] if row['kind'] == KIND_DELTA)
+            if changed_ratio == 0:
+                kind = KIND_SAME
+            elif changed_ratio <= KEYFRAME_CHANGED_RATIO and deltas < KEYFRAME_INTERVAL:
+                kind = KIND_DELTA
+
+    filename = ''
+    if kind == KIND_KEY:
+        filename = f"v{version:04d}.png"
+        image.save(os.path.join(folder, filename), optimize=True)
+    elif kind == KIND_DELTA:
+        filename = f"v{version:04d}.npz"
+        tiles = _to_tiles(current)[coords[:, 0], coords[:, 1]]
+        np.savez_compressed(os.path.join(folder, filename),
+                            coords=coords.astype(np.int32), tiles=tiles)
+
+    entry = {
+        'username': username,
+        'version': version,
+        'captured_at': f"{captured_at:.0f}",
+        'kind': kind,
+        'changed_ratio': f"{changed_ratio:.4f}",
+        'file': filename,
+    }
+    _append_index(history_dir, entry, rows)
+    return entry
+
+
+def timeline(history_dir, username):
+    """返回帳號的所有版本（版本號、截圖時間、種類、變化比例）"""
+    return load_history_index(history_dir, username)
+
+
+def changed_since(history_dir, since, min_changed_ratio=0.0):
+    """返回在 since（epoch 秒）之後有變化的帳號與其最大變化比例，只讀取索引"""
+    changed = {}
+    for row in load_history_index(history_dir):
+        # 每個帳號的第一版沒有比較對象，不算變化
+        if row['captured_at'] > since and row['version'] > 1 \
+                and row['changed_ratio'] > min_changed_ratio and row['kind'] != KIND_SAME:
+            changed[row['username']] = max(changed.get(row['username'], 0), row['changed_ratio'])
+    return changed
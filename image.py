@@ -6,6 +6,8 @@ Instagram 頁面截圖爬蟲
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.common.by import By
+from selenium.common.exceptions import TimeoutException
 from webdriver_manager.chrome import ChromeDriverManager
 import time
 import csv
@@ -13,10 +15,54 @@ import os
 import re
 from PIL import Image
 import io
+import base64
+import heapq
+import socket
+import threading
 
+from capture_state import (
+    STATUS_OK, STATUS_PRIVATE, STATUS_NOT_FOUND, STATUS_RATE_LIMITED,
+    STATUS_LOGIN_WALL, STATUS_TIMEOUT, STATUS_ERROR, STATUS_BAD_CAPTURE, DONE_STATUSES,
+    load_capture_state, save_capture_state, append_capture_state, record_outcome, should_skip,
+    next_retry_time, publish_review_index,
+)
+from archive import archive_capture_file, load_archive_index
+from capture_check import check_capture
+from history import add_capture
+from tracing import enable_tracing, begin_trace, mark, end_trace
+from navigation import PAGE_LOAD_STRATEGY, NAVIGATION_DEADLINE, set_page_load_strategy, navigate
+from scheduler import (
+    PRIORITY_WEIGHTS, band_from_filename, load_follower_counts, priority_score, due_for_refresh,
+    update_rate, estimate_remaining, within_budget, format_eta,
+)
 
-def setup_driver():
-    """設定 Chrome WebDriver"""
+
+# 區域截圖預設選擇器：(CSS 選擇器, 最多取幾個元素)
+# 個人檔案標頭（追蹤數、簡介）與貼文格狀區前兩列（每列 3 篇）
+REGION_SELECTORS = [
+    ("main header", 1),
+    ("main a[href*='/p/'], main a[href*='/reel/']", 6),
+]
+
+# 個人檔案頁面可用的判斷：出現標頭或登入表單，或出現 PROFILE_READY_TEXTS 中的頁面訊息
+PROFILE_READY_SELECTOR = 'main header, input[name="username"]'
+
+# 個人檔案資料輸出欄位，每累積 PROFILE_BATCH_SIZE 筆寫入一次
+PROFILE_FIELDS = ['username', 'url', 'followers', 'following', 'posts', 'full_name', 'bio', 'extracted_at']
+PROFILE_BATCH_SIZE = 20
+
+# 數字縮寫的倍數（K、M、萬、億）
+COUNT_MULTIPLIERS = {
+    'k': 1_000, 'm': 1_000_000, 'b': 1_000_000_000,
+    '萬': 10_000, '万': 10_000, '億': 100_000_000, '亿': 100_000_000,
+}
+
+
+def setup_driver(trace=False, page_load_strategy=PAGE_LOAD_STRATEGY, proxy=None):
+    """設定 Chrome WebDriver（trace 為 True 時開啟效能追蹤紀錄，載入策略見 navigation.py）
+
+    proxy 為代理位址（例如 http://10.0.0.1:3128），設定後所有流量經由該代理
+    """
     chrome_options = Options()
     # 取消註解下面這行可以讓瀏覽器在背景執行（無頭模式）
     # chrome_options.add_argument('--headless')
@@ -29,9 +75,16 @@ def setup_driver():
     # 設定 user agent
     chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36')
     
+    if proxy:
+        chrome_options.add_argument(f'--proxy-server={proxy}')
+    if trace:
+        enable_tracing(chrome_options)
+    set_page_load_strategy(chrome_options, page_load_strategy)
+    
     # 使用 webdriver-manager 自動管理 ChromeDriver
     service = Service(ChromeDriverManager().install())
     driver = webdriver.Chrome(service=service, options=chrome_options)
+    driver.set_page_load_timeout(NAVIGATION_DEADLINE)
     return driver
 
 
@@ -98,8 +151,19 @@ def wait_for_page_load(driver, wait_time=2):
         time.sleep(wait_time)
 
 
+def save_screenshot_png(driver, save_path):
+    """截取目前畫面並存檔，返回已解碼的圖片供品質檢查使用"""
+    png = driver.get_screenshot_as_png()
+    with open(save_path, 'wb') as f:
+        f.write(png)
+    return Image.open(io.BytesIO(png))
+
+
 def take_full_page_screenshot(driver, save_path):
-    """進行長截圖（全頁面截圖）"""
+    """進行長截圖（全頁面截圖），返回存檔的圖片（PIL），失敗時返回 None
+
+    返回的圖片直接交給品質檢查，不必再從檔案重新解碼
+    """
     try:
         # 確保視窗最大化
         print("最大化瀏覽器視窗...")
@@ -125,8 +189,7 @@ def take_full_page_screenshot(driver, save_path):
         # 如果頁面高度小於視窗高度，直接截圖
         if total_height <= viewport_height:
             wait_for_page_load(driver, wait_time=2)
-            driver.save_screenshot(save_path)
-            return True
+            return save_screenshot_png(driver, save_path)
         
         # 需要滾動截圖並合併（最多5張，增加截圖數量）
         max_screenshots = 5  # 增加截圖數量限制
@@ -177,6 +240,7 @@ def take_full_page_screenshot(driver, save_path):
         if len(screenshots) == 1:
             with open(save_path, 'wb') as f:
                 f.write(screenshots[0])
+            merged_image = Image.open(io.BytesIO(screenshots[0]))
         else:
             # 只取前 max_screenshots 張截圖
             screenshots = screenshots[:max_screenshots]
@@ -199,17 +263,241 @@ def take_full_page_screenshot(driver, save_path):
             if len(screenshots) >= max_screenshots:
                 print(f"注意：頁面過長，只截取了前 {max_screenshots} 張截圖")
         
-        return True
+        return merged_image
     except Exception as e:
         print(f"截圖時發生錯誤: {e}")
         # 如果長截圖失敗，嘗試簡單截圖
         try:
-            driver.save_screenshot(save_path)
+            image = save_screenshot_png(driver, save_path)
             print("已使用簡單截圖作為備用方案")
-            return True
+            return image
         except Exception as e2:
             print(f"簡單截圖也失敗: {e2}")
-            return False
+            return None
+
+
+def get_region_rects(driver, selectors=None):
+    """以單次 execute_script 取得各選擇器對應區域在頁面上的座標（多個元素取聯集）"""
+    if selectors is None:
+        selectors = REGION_SELECTORS
+
+    return driver.execute_script("""
+        let rects = [];
+        for (let [selector, limit] of arguments[0]) {
+            let elements = Array.from(document.querySelectorAll(selector)).slice(0, limit);
+            let left = Infinity, top = Infinity, right = -Infinity, bottom = -Infinity;
+            for (let el of elements) {
+                let rect = el.getBoundingClientRect();
+                if (rect.width === 0 || rect.height === 0) continue;
+                left = Math.min(left, rect.left + window.pageXOffset);
+                top = Math.min(top, rect.top + window.pageYOffset);
+                right = Math.max(right, rect.right + window.pageXOffset);
+                bottom = Math.max(bottom, rect.bottom + window.pageYOffset);
+            }
+            if (right > left && bottom > top) {
+                rects.push({selector: selector, x: left, y: top, width: right - left, height: bottom - top});
+            }
+        }
+        return rects;
+    """, [list(item) for item in selectors])
+
+
+def _screenshot_region_elements(driver, rect, selectors):
+    """以 WebElement.screenshot 截取區域內每個元素，貼回區域畫布上的相對位置
+
+    元素座標為 CSS 像素，截圖為裝置像素，需乘上 devicePixelRatio 才能對齊
+    """
+    limit = next(limit for selector, limit in selectors if selector == rect["selector"])
+    elements = driver.find_elements(By.CSS_SELECTOR, rect["selector"])[:limit]
+    if not elements:
+        return None
+
+    scale = driver.execute_script("return window.devicePixelRatio") or 1
+    canvas = Image.new('RGB', (round(rect["width"] * scale), round(rect["height"] * scale)), (255, 255, 255))
+    for element in elements:
+        element_rect = element.rect
+        img = Image.open(io.BytesIO(element.screenshot_as_png))
+        canvas.paste(img, (round((element_rect["x"] - rect["x"]) * scale),
+                           round((element_rect["y"] - rect["y"]) * scale)))
+    return canvas
+
+
+def take_region_screenshot(driver, save_path, selectors=None):
+    """只截取指定元素區域（個人檔案標頭、貼文格狀區），多個區域由上而下拼接
+
+    返回存檔的圖片（PIL），失敗時返回 None
+    """
+    try:
+        # 等待可見區域的圖片載入（標頭與前幾列貼文通常都在第一個畫面內）
+        wait_for_page_load(driver, wait_time=1)
+
+        rects = get_region_rects(driver, selectors)
+        if not rects:
+            print("找不到指定的截圖區域")
+            return None
+
+        region_images = []
+        for rect in rects:
+            try:
+                # 使用 CDP clip 直接截取該區域，不需要滾動
+                result = driver.execute_cdp_cmd("Page.captureScreenshot", {
+                    "format": "png",
+                    "captureBeyondViewport": True,
+                    "clip": {
+                        "x": rect["x"],
+                        "y": rect["y"],
+                        "width": rect["width"],
+                        "height": rect["height"],
+                        "scale": 1,
+                    },
+                })
+                png = base64.b64decode(result["data"])
+            except Exception as cdp_error:
+                # CDP 無法使用時，改用 WebElement.screenshot 逐一截取元素再依位置貼回
+                print(f"CDP 區域截圖失敗，改用元素截圖: {cdp_error}")
+                region_images.append(
+                    _screenshot_region_elements(driver, rect, selectors or REGION_SELECTORS)
+                )
+                continue
+            region_images.append(Image.open(io.BytesIO(png)))
+
+        region_images = [img for img in region_images if img is not None]
+
+        if not region_images:
+            print("區域截圖失敗")
+            return None
+
+        if len(region_images) == 1:
+            merged_image = region_images[0]
+            merged_image.save(save_path)
+        else:
+            total_width = max(img.width for img in region_images)
+            merged_height = sum(img.height for img in region_images)
+            merged_image = Image.new('RGB', (total_width, merged_height), (255, 255, 255))
+            y_offset = 0
+            for img in region_images:
+                merged_image.paste(img, (0, y_offset))
+                y_offset += img.height
+            merged_image.save(save_path)
+
+        print(f"已截取 {len(region_images)} 個區域")
+        return merged_image
+    except Exception as e:
+        print(f"區域截圖時發生錯誤: {e}")
+        return None
+
+
+def parse_count(text):
+    """將 "1,234"、"12.3K"、"1.2萬" 之類的文字轉為整數，無法解析時返回 None"""
+    if text is None:
+        return None
+    match = re.search(r'([\d.,]+)\s*([kKmMbB萬万億亿]?)', str(text))
+    if not match:
+        return None
+    number = match.group(1).replace(',', '')
+    unit = match.group(2).lower()
+    # 沒有單位時，"1.234"、"12.345.678" 這種每段三位數的點是千分位，不是小數點
+    if not unit and re.fullmatch(r'\d{1,3}(\.\d{3})+', number):
+        number = number.replace('.', '')
+    try:
+        value = float(number)
+    except ValueError:
+        return None
+    if unit:
+        value *= COUNT_MULTIPLIERS[unit]
+    return int(round(value))
+
+
+def parse_profile_description(description):
+    """解析 og:description（例："1,234 Followers, 56 Following, 78 Posts - ..."）"""
+    result = {'followers': None, 'following': None, 'posts': None, 'full_name': None}
+    if not description:
+        return result
+
+    patterns = {
+        'followers': [r'([\d.,]+\s*[kKmMbB萬万億亿]?)\s*(?:Followers|位粉絲|位粉丝)'],
+        'following': [r'([\d.,]+\s*[kKmMbB萬万億亿]?)\s*(?:Following|人追蹤中|人追踪中|正在追蹤)'],
+        'posts': [r'([\d.,]+\s*[kKmMbB萬万億亿]?)\s*(?:Posts|篇貼文|篇帖子)'],
+    }
+    for field, field_patterns in patterns.items():
+        for pattern in field_patterns:
+            match = re.search(pattern, description)
+            if match:
+                result[field] = parse_count(match.group(1))
+                break
+
+    # 顯示名稱（例："from Name (@user)" 或 "查看 Name (@user) 的"）
+    match = re.search(r'(?:from|查看)\s+(.+?)\s*\(@[^)]+\)', description)
+    if match:
+        result['full_name'] = match.group(1).strip()
+    return result
+
+
+def parse_profile_header(header_text, full_name=None):
+    """從個人檔案標頭的文字中取出簡介（位於追蹤數與顯示名稱之後的行）"""
+    if not header_text:
+        return ''
+    lines = [line.strip() for line in header_text.split('\n') if line.strip()]
+
+    # 找到最後一行統計數字（貼文、粉絲、追蹤中）
+    stats_pattern = re.compile(r'(posts|followers|following|貼文|粉絲|追蹤中)', re.IGNORECASE)
+    last_stats_index = -1
+    for i, line in enumerate(lines):
+        if stats_pattern.search(line) and re.search(r'\d', line):
+            last_stats_index = i
+    bio_lines = lines[last_stats_index + 1:]
+
+    # 移除顯示名稱
+    if bio_lines and full_name and bio_lines[0] == full_name:
+        bio_lines = bio_lines[1:]
+    return '\n'.join(bio_lines)
+
+
+def extract_profile_data(driver, url=None):
+    """以單次 execute_script 從已載入的個人檔案頁面取出追蹤數、貼文數與簡介"""
+    try:
+        raw = driver.execute_script("""
+            let meta = (name) => {
+                let el = document.querySelector(`meta[property="${name}"], meta[name="${name}"]`);
+                return el ? el.getAttribute('content') : null;
+            };
+            let header = document.querySelector('main header');
+            return {
+                description: meta('og:description') || meta('description'),
+                title: meta('og:title'),
+                header_text: header ? header.innerText : '',
+            };
+        """)
+    except Exception as e:
+        print(f"擷取個人檔案資料時發生錯誤: {e}")
+        return None
+
+    if not raw or not (raw.get('description') or raw.get('header_text')):
+        return None
+
+    data = parse_profile_description(raw.get('description'))
+    data['bio'] = parse_profile_header(raw.get('header_text'), data['full_name'])
+    data['url'] = url or driver.current_url
+    data['username'] = extract_username_from_url(data['url'])
+    data['extracted_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    return data
+
+
+def flush_profile_rows(profile_csv, rows):
+    """將累積的個人檔案資料批次寫入 CSV，寫入後清空 rows"""
+    if not rows:
+        return
+    try:
+        write_header = not os.path.exists(profile_csv)
+        with open(profile_csv, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=PROFILE_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerows(rows)
+        print(f"已寫入 {len(rows)} 筆個人檔案資料到 {profile_csv}")
+        rows.clear()
+    except Exception as e:
+        print(f"寫入個人檔案資料時發生錯誤: {e}")
 
 
 def update_csv_image_done(csv_filename, url, status="true"):
@@ -252,8 +540,198 @@ def update_csv_image_done(csv_filename, url, status="true"):
         return False
 
 
-def screenshot_instagram_pages(csv_filename='link.csv', image_folder='image'):
-    """讀取 CSV 檔案，對未完成的 Instagram 頁面進行截圖"""
+# 頁面文字特徵，用來判斷截圖結果分類（英文與中文介面）
+PAGE_SIGNATURES = {
+    STATUS_RATE_LIMITED: ["Please wait a few minutes", "Try Again Later", "請稍候幾分鐘", "稍後再試"],
+    STATUS_NOT_FOUND: ["Sorry, this page isn't available", "很抱歉，無法使用此頁面", "無法使用此頁面"],
+    STATUS_PRIVATE: ["This account is private", "This Account is Private", "這是私人帳號", "此帳號為私人帳號"],
+}
+# 頁面出現任一訊息（或跳轉到驗證頁面）就可以判斷結果分類，不必等待標頭
+PROFILE_READY_TEXTS = ['/challenge/'] + [text for texts in PAGE_SIGNATURES.values() for text in texts]
+
+# 遇到頻率限制時，整體暫停的秒數
+RATE_LIMIT_PAUSE = 60
+
+
+def classify_page_content(page):
+    """依頁面資訊（URL、文字、元素是否存在）判斷結果分類"""
+    url = page.get('url') or ''
+    text = page.get('text') or ''
+
+    if '/challenge/' in url or any(s in text for s in PAGE_SIGNATURES[STATUS_RATE_LIMITED]):
+        return STATUS_RATE_LIMITED
+    if any(s in text for s in PAGE_SIGNATURES[STATUS_NOT_FOUND]):
+        return STATUS_NOT_FOUND
+    # 未登入時會跳轉到登入頁，或在個人檔案上蓋一層登入表單
+    if '/accounts/login' in url or page.get('has_login_form'):
+        return STATUS_LOGIN_WALL
+    if any(s in text for s in PAGE_SIGNATURES[STATUS_PRIVATE]):
+        return STATUS_PRIVATE
+    if page.get('has_header'):
+        return STATUS_OK
+    if page.get('ready_state') != 'complete':
+        return STATUS_TIMEOUT
+    return STATUS_ERROR
+
+
+# 取得判斷結果分類所需的頁面資訊（execute_script 與 CDP Runtime.evaluate 共用）
+PAGE_STATE_SCRIPT = """
+    return {
+        url: location.href,
+        ready_state: document.readyState,
+        has_header: !!document.querySelector('main header'),
+        has_login_form: !!document.querySelector('input[name="username"]'),
+        text: document.body ? document.body.innerText.slice(0, 5000) : '',
+    };
+"""
+
+
+def classify_page(driver):
+    """以單次 execute_script 取得頁面資訊並判斷結果分類"""
+    try:
+        page = driver.execute_script(PAGE_STATE_SCRIPT)
+    except Exception as e:
+        print(f"判斷頁面狀態時發生錯誤: {e}")
+        return STATUS_ERROR
+    return classify_page_content(page or {})
+
+
+def capture_profile(driver, url, username, image_folder, capture_mode='full',
+                    region_selectors=None, profile_rows=None, record_dir=None, archive_dir=None,
+                    trace=None, history_dir=None, deadline=NAVIGATION_DEADLINE):
+    """在目前分頁開啟個人檔案頁面，判斷結果分類後截圖，返回結果分類
+
+    設定 record_dir 時會把頁面 HTML 存成快照，供 replay.py 離線重播
+    設定 archive_dir 時截圖會寫入封存分片，不保留散檔
+    trace 為 tracing.begin_trace 的追蹤狀態，用來記錄導覽與截圖各階段的時間
+    設定 history_dir 時截圖會加入該帳號的歷史時間軸（見 history.py）
+    deadline 為開啟頁面的秒數上限，逾時會停止載入並重試一次，仍失敗時返回逾時
+    """
+    print(f"正在開啟頁面...")
+    if not navigate(driver, url, PROFILE_READY_SELECTOR, deadline, texts=PROFILE_READY_TEXTS):
+        print(f"頁面載入逾時")
+        return STATUS_TIMEOUT
+    mark(trace, 'navigated')
+
+    if record_dir:
+        from replay import record_snapshot
+        record_snapshot(driver, record_dir, 'profile', username)
+
+    status = classify_page(driver)
+    if status not in DONE_STATUSES:
+        print(f"頁面狀態為 {status}，不進行截圖")
+        return status
+
+    # 擷取個人檔案資料（與截圖共用已載入的頁面）
+    if profile_rows is not None:
+        profile = extract_profile_data(driver, url)
+        if profile:
+            print(f"粉絲: {profile['followers']}，貼文: {profile['posts']}")
+            profile_rows.append(profile)
+
+    # 進行截圖：先寫入暫存檔，通過品質檢查後才取代先前的截圖
+    image_path = os.path.join(image_folder, f"{username}.png")
+    pending_path = os.path.join(image_folder, f"{username}.pending.png")
+    print(f"正在截圖...")
+
+    if capture_mode == 'region':
+        captured = take_region_screenshot(driver, pending_path, region_selectors)
+    else:
+        captured = take_full_page_screenshot(driver, pending_path)
+    mark(trace, 'captured')
+
+    if captured is None:
+        print(f"截圖失敗")
+        if os.path.exists(pending_path):
+            os.remove(pending_path)
+        return STATUS_ERROR
+
+    # 品質檢查：空白、重複畫面或登入遮罩的截圖送回重試佇列（直接檢查記憶體中的圖片，不重新讀檔）
+    segment_height = None
+    if capture_mode != 'region':
+        segment_height = driver.execute_script("return window.innerHeight * window.devicePixelRatio")
+    problems, scores = check_capture(captured, segment_height)
+    if problems:
+        print(f"截圖品質不佳: {problems} {scores}")
+        os.remove(pending_path)
+        return STATUS_BAD_CAPTURE
+
+    os.replace(pending_path, image_path)
+    print(f"截圖已儲存: {image_path}")
+
+    if history_dir:
+        try:
+            entry = add_capture(history_dir, username, image_path)
+            print(f"已加入歷史紀錄：第 {entry['version']} 版（{entry['kind']}，變化 {entry['changed_ratio']}）")
+        except Exception as e:
+            print(f"加入歷史紀錄時發生錯誤: {e}")
+
+    if archive_dir and not archive_capture_file(archive_dir, username, image_path):
+        return STATUS_ERROR
+    return status
+
+
+def close_extra_tabs(driver, first_tab_handle):
+    """關閉第一個分頁（登入用）以外的所有分頁，並切換回第一個分頁"""
+    try:
+        for handle in driver.window_handles:
+            if handle != first_tab_handle:
+                try:
+                    driver.switch_to.window(handle)
+                    driver.close()
+                except:
+                    pass
+        driver.switch_to.window(first_tab_handle)
+    except Exception as switch_error:
+        print(f"切換分頁時發生錯誤: {switch_error}")
+
+
+def last_capture_time(row, archive_entries=None, image_path=None):
+    """上次成功截圖的時間戳，依序參考封存索引、截圖狀態與圖檔修改時間，從未截圖時返回 None
+
+    設定封存資料夾時圖檔存入封存後會被刪除，不能只看圖檔的修改時間
+    """
+    if archive_entries:
+        captured_at = archive_entries[-1]['captured_at']
+        try:
+            return time.mktime(time.strptime(captured_at, '%Y%m%dT%H%M%S'))
+        except ValueError:
+            pass
+    if row and row.get('status') in DONE_STATUSES and row.get('last_attempt_at'):
+        return float(row['last_attempt_at'])
+    if image_path and os.path.exists(image_path):
+        return os.path.getmtime(image_path)
+    return None
+
+
+def screenshot_instagram_pages(csv_filename='link.csv', image_folder='image',
+                               capture_mode='full', region_selectors=None,
+                               profile_csv='profile.csv', state_filename='capture_state.csv',
+                               record_dir=None, review_index_dir=None, archive_dir=None,
+                               trace_dir=None, trace_threshold=30, trace_sample_rate=0.0,
+                               priority_weights=None, time_budget=None, history_dir=None,
+                               page_load_strategy=PAGE_LOAD_STRATEGY,
+                               navigation_deadline=NAVIGATION_DEADLINE, refresh_days=None):
+    """讀取 CSV 檔案，對未完成的 Instagram 頁面進行截圖
+
+    capture_mode 為 'full' 時進行長截圖，為 'region' 時只截取 region_selectors
+    指定的區域（預設為個人檔案標頭與貼文格狀區前兩列）
+    截圖前會同時擷取追蹤數、貼文數與簡介，批次寫入 profile_csv（設為 None 則停用）
+    每個 URL 的結果分類記錄在 state_filename；暫時性失敗（頻率限制、登入牆、逾時）
+    會以指數退避延後重試，永久失敗（頁面不存在）之後不再處理
+    設定 record_dir 時會錄製每個個人檔案頁的 HTML 快照
+    設定 review_index_dir 時，結束後會為審核介面發布預先計算的索引
+    設定 archive_dir 時截圖會寫入封存分片（見 archive.py），不在 image_folder 留下散檔
+    設定 trace_dir 時會記錄每個個人檔案的效能摘要，耗時超過 trace_threshold 秒
+    或依 trace_sample_rate 抽樣的個人檔案另外保存完整的 Chrome 追蹤檔
+    待處理項目依優先分數排序（粉絲數、上次截圖新舊、重試次數，權重見 priority_weights），
+    設定 time_budget（秒）時，預估來不及處理下一筆就提前結束
+    設定 refresh_days 時，已完成但超過 refresh_days 天未截圖的帳號也會重新截圖，
+    與未完成的項目一起依優先分數排序（越久沒截圖越優先）
+    設定 history_dir 時每次截圖都會加入帳號的歷史時間軸，只保存與前一版不同的區塊
+    page_load_strategy 為 Chrome 載入策略（預設 eager，不等待第三方資源），每個 URL
+    開啟頁面最多等待 navigation_deadline 秒，逾時會停止載入並重試，仍失敗則延後重試
+    """
     # 建立 image 資料夾
     if not os.path.exists(image_folder):
         os.makedirs(image_folder)
@@ -264,15 +742,97 @@ def screenshot_instagram_pages(csv_filename='link.csv', image_folder='image'):
         print(f"錯誤：找不到 CSV 檔案 {csv_filename}")
         return
     
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        headers = next(reader, None)
+        rows = list(reader)
+    
+    if headers is None or len(headers) < 2:
+        print("錯誤：CSV 檔案格式不正確")
+        return
+    
+    state = load_capture_state(state_filename)
+    
+    # 粉絲數：優先使用已擷取的個人檔案資料，否則使用檔名中的粉絲級距下限
+    follower_counts = load_follower_counts(profile_csv)
+    band = band_from_filename(csv_filename)
+    band_followers = band[0] if band else None
+    archive_index = load_archive_index(archive_dir) if archive_dir else {}
+    
+    processed_count = 0
+    skipped_count = 0
+    error_count = 0
+    retry_count = 0
+    status_counts = {}
+    
+    # 待處理佇列：ready 依 (-優先分數, 原始順序) 排序；delayed 為等待重試的項目，依可處理時間排序
+    ready = []
+    delayed = []
+    for seq, row in enumerate(rows):
+        if not row or len(row) == 0 or not row[0]:
+            continue
+        
+        url = row[0].strip().strip('"')  # 移除可能的引號
+        image_done = row[1].strip().strip('"').lower() if len(row) > 1 else ""
+        row_state = state.get(url)
+        done = image_done == "true" or (row_state or {}).get('status') in DONE_STATUSES
+        
+        # 已完成的 URL 除非設定 refresh_days 且上次截圖已過期，否則跳過
+        if done and not refresh_days:
+            skipped_count += 1
+            continue
+        
+        # 永久失敗或重試次數用盡的 URL 不再處理（包含重新截圖失敗的帳號）
+        if should_skip(row_state) and (row_state or {}).get('status') not in DONE_STATUSES:
+            print(f"\n跳過（狀態為 {row_state['status']}）: {url}")
+            skipped_count += 1
+            continue
+        
+        # 提取帳號名稱
+        username = extract_username_from_url(url)
+        if not username:
+            print(f"\n無法從 URL 提取帳號名稱: {url}")
+            error_count += 1
+            continue
+        
+        image_path = os.path.join(image_folder, f"{username}.png")
+        last_captured_at = last_capture_time(row_state, archive_index.get(username), image_path)
+        attempts = int((row_state or {}).get('attempts') or 0)
+        if done:
+            if not due_for_refresh(last_captured_at, refresh_days):
+                skipped_count += 1
+                continue
+            # 新一輪重新截圖從零開始計算重試次數，避免先前成功的次數讓失敗時提早放棄
+            if row_state and row_state.get('status') in DONE_STATUSES:
+                attempts = 0
+                row_state['attempts'] = '0'
+        
+        priority = priority_score(
+            follower_counts.get(username, band_followers),
+            last_captured_at,
+            attempts,
+            weights=priority_weights,
+        )
+        due = next_retry_time(row_state)
+        if due > time.time():
+            heapq.heappush(delayed, (due, -priority, seq, url, username))
+        else:
+            heapq.heappush(ready, (-priority, seq, url, username))
+    
+    print(f"\n待處理: {len(ready) + len(delayed)} 筆，跳過已完成: {skipped_count} 筆")
+    if not ready and not delayed:
+        return
+    
     # 初始化 driver
-    driver = setup_driver()
+    driver = setup_driver(trace=bool(trace_dir), page_load_strategy=page_load_strategy)
+    profile_rows = []
     
     try:
         # 開啟 Instagram 首頁並等待使用者登入
         print("\n" + "="*50)
         print("正在開啟 Instagram 首頁...")
         print("="*50)
-        driver.get("https://www.instagram.com/")
+        navigate(driver, "https://www.instagram.com/", deadline=navigation_deadline)
         
         # 儲存第一個 tab 的 window handle（登入用的 tab）
         first_tab_handle = driver.current_window_handle
@@ -282,147 +842,261 @@ def screenshot_instagram_pages(csv_filename='link.csv', image_folder='image'):
         time.sleep(120)
         print("\n登入等待時間結束，開始處理截圖任務...")
         
-        # 讀取 CSV 並處理每一筆資料
-        with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile)
-            headers = next(reader, None)
+        started_at = time.time()
+        seconds_per_profile = None
+        
+        while ready or delayed:
+            # 時間預算不足以處理下一筆時提前結束
+            if not within_budget(started_at, time_budget, seconds_per_profile):
+                print(f"\n時間預算即將用完，剩餘 {len(ready) + len(delayed)} 筆留待下次處理")
+                break
             
-            if headers is None or len(headers) < 2:
-                print("錯誤：CSV 檔案格式不正確")
-                return
+            # 重試時間已到的項目移回 ready；沒有可處理的項目時等待最早的重試
+            if not ready:
+                wait_seconds = delayed[0][0] - time.time()
+                # 最早的重試在時間預算結束前來不及處理時不再等待
+                if not within_budget(started_at, time_budget, seconds_per_profile, wait_seconds):
+                    print(f"\n最早的重試需等待 {wait_seconds:.0f} 秒，超出時間預算，剩餘 {len(delayed)} 筆留待下次處理")
+                    break
+                if wait_seconds > 0:
+                    print(f"\n等待 {wait_seconds:.0f} 秒後重試: {delayed[0][3]}")
+                    time.sleep(wait_seconds)
+            while delayed and delayed[0][0] <= time.time():
+                due, neg_priority, seq, url, username = heapq.heappop(delayed)
+                heapq.heappush(ready, (neg_priority, seq, url, username))
             
-            processed_count = 0
-            skipped_count = 0
-            error_count = 0
+            neg_priority, seq, url, username = heapq.heappop(ready)
+            item_started_at = time.time()
             
-            for row in reader:
-                if not row or len(row) == 0 or not row[0]:
-                    continue
-                
-                url = row[0].strip().strip('"')  # 移除可能的引號
-                image_done = row[1].strip().strip('"').lower() if len(row) > 1 else ""
-                
-                # 檢查是否已完成（如果 image_done 是 "true" 則跳過）
-                if image_done == "true":
-                    skipped_count += 1
-                    print(f"\n跳過已完成: {url}")
-                    continue
-                
-                # 提取帳號名稱
-                username = extract_username_from_url(url)
-                if not username:
-                    print(f"\n無法從 URL 提取帳號名稱: {url}")
-                    error_count += 1
-                    continue
-                
-                print(f"\n{'='*50}")
-                print(f"處理: {url}")
-                print(f"帳號名稱: {username}")
-                print(f"{'='*50}")
+            print(f"\n{'='*50}")
+            print(f"處理: {url}")
+            print(f"帳號名稱: {username}")
+            print(f"{'='*50}")
+            
+            trace = None
+            try:
+                # 開啟新 tab
+                print(f"正在開啟新分頁...")
+                driver.switch_to.new_window('tab')
+                if trace_dir:
+                    trace = begin_trace(driver, username, url)
                 
-                try:
-                    # 開啟新 tab
-                    print(f"正在開啟新分頁...")
-                    driver.switch_to.new_window('tab')
-                    new_tab_handle = driver.current_window_handle
-                    
-                    # 在新 tab 中開啟頁面
-                    print(f"正在開啟頁面...")
-                    driver.get(url)
-                    time.sleep(5)  # 等待頁面載入
-                    
-                    # 進行長截圖
-                    image_path = os.path.join(image_folder, f"{username}.png")
-                    print(f"正在截圖...")
-                    
-                    success = take_full_page_screenshot(driver, image_path)
-                    
-                    if success:
-                        print(f"截圖已儲存: {image_path}")
-                        
-                        # 更新 CSV
-                        if update_csv_image_done(csv_filename, url, "true"):
-                            print(f"已更新 CSV: image_done = true")
-                            processed_count += 1
-                        else:
-                            print(f"警告：無法更新 CSV")
-                            error_count += 1
-                    else:
-                        print(f"截圖失敗")
-                        error_count += 1
-                    
-                    # 先切換回第一個 tab（登入用的 tab），再關閉新 tab
-                    print(f"正在切換回第一個分頁...")
-                    try:
-                        driver.switch_to.window(first_tab_handle)
-                    except Exception as switch_error:
-                        print(f"切換到第一個分頁時發生錯誤: {switch_error}")
-                    
-                    # 關閉新開啟的 tab（確保不會關閉最後一個 tab）
-                    print(f"正在關閉分頁...")
-                    try:
-                        # 檢查是否還有其他 tab
-                        all_handles = driver.window_handles
-                        if len(all_handles) > 1 and new_tab_handle in all_handles:
-                            driver.switch_to.window(new_tab_handle)
-                            driver.close()
-                            # 再次確保切換回第一個 tab
-                            driver.switch_to.window(first_tab_handle)
-                    except Exception as close_error:
-                        print(f"關閉分頁時發生錯誤: {close_error}")
-                        # 如果關閉失敗，確保切換回第一個 tab
-                        try:
-                            driver.switch_to.window(first_tab_handle)
-                        except:
-                            pass
-                    
-                    # 短暫延遲，避免請求過快
-                    time.sleep(2)
-                    
-                except Exception as e:
-                    print(f"處理 {url} 時發生錯誤: {e}")
-                    # 確保切換回第一個 tab，並關閉可能開啟的新 tab
-                    try:
-                        # 獲取所有 window handles
-                        all_handles = driver.window_handles
-                        # 如果有多個 tab，關閉非第一個 tab
-                        if len(all_handles) > 1:
-                            for handle in all_handles:
-                                if handle != first_tab_handle:
-                                    try:
-                                        driver.switch_to.window(handle)
-                                        driver.close()
-                                    except:
-                                        pass
-                        # 切換回第一個 tab
-                        driver.switch_to.window(first_tab_handle)
-                    except Exception as switch_error:
-                        print(f"切換分頁時發生錯誤: {switch_error}")
+                status = capture_profile(
+                    driver, url, username, image_folder, capture_mode,
+                    region_selectors, profile_rows if profile_csv else None, record_dir,
+                    archive_dir, trace, history_dir, navigation_deadline
+                )
+            except TimeoutException:
+                status = STATUS_TIMEOUT
+            except Exception as e:
+                print(f"處理 {url} 時發生錯誤: {e}")
+                status = STATUS_ERROR
+            
+            if trace is not None:
+                end_trace(driver, trace, trace_dir, trace_threshold, trace_sample_rate)
+            
+            # 先切換回第一個 tab（登入用的 tab），並關閉截圖用的 tab
+            print(f"正在關閉分頁...")
+            close_extra_tabs(driver, first_tab_handle)
+            
+            # 記錄結果分類
+            status_counts[status] = status_counts.get(status, 0) + 1
+            next_retry_at = record_outcome(state, url, status)
+            append_capture_state(state_filename, [state[url]])
+            
+            if status in DONE_STATUSES:
+                # 更新 CSV
+                if update_csv_image_done(csv_filename, url, "true"):
+                    print(f"已更新 CSV: image_done = true")
+                    processed_count += 1
+                else:
+                    print(f"警告：無法更新 CSV")
                     error_count += 1
-                    continue
+            elif next_retry_at:
+                print(f"狀態 {status}，將於 {next_retry_at - time.time():.0f} 秒後重試")
+                # 重試會降低優先分數
+                retry_priority = neg_priority - (priority_weights or PRIORITY_WEIGHTS).get('attempts', 0)
+                heapq.heappush(delayed, (next_retry_at, retry_priority, seq, url, username))
+                retry_count += 1
+            else:
+                print(f"狀態 {status}，不再重試")
+                error_count += 1
+            
+            if profile_csv and len(profile_rows) >= PROFILE_BATCH_SIZE:
+                flush_profile_rows(profile_csv, profile_rows)
+            
+            # 遇到頻率限制時暫停較長時間，其餘情況短暫延遲，避免請求過快
+            if status == STATUS_RATE_LIMITED:
+                print(f"遇到頻率限制，暫停 {RATE_LIMIT_PAUSE} 秒...")
+                time.sleep(RATE_LIMIT_PAUSE)
+            else:
+                time.sleep(2)
+            
+            # 以實測的每筆處理時間估算剩餘時間
+            seconds_per_profile = update_rate(seconds_per_profile, time.time() - item_started_at)
+            remaining = len(ready) + len(delayed)
+            print(f"每筆約 {seconds_per_profile:.1f} 秒，剩餘 {remaining} 筆，"
+                  f"預估 {format_eta(estimate_remaining(remaining, seconds_per_profile))}")
         
         print(f"\n{'='*50}")
         print(f"截圖任務完成！")
         print(f"成功處理: {processed_count} 筆")
         print(f"跳過: {skipped_count} 筆")
+        print(f"重試: {retry_count} 次")
         print(f"錯誤: {error_count} 筆")
+        print(f"結果分類: {status_counts}")
         print(f"{'='*50}")
         
     except Exception as e:
-        print(f"讀取 CSV 時發生錯誤: {e}")
+        print(f"處理截圖任務時發生錯誤: {e}")
     finally:
+        save_capture_state(state_filename, state)
+        if profile_csv:
+            flush_profile_rows(profile_csv, profile_rows)
+        if review_index_dir:
+            publish_review_index(csv_filename, review_index_dir)
         if driver:
             driver.quit()
             print("瀏覽器已關閉")
 
 
+def screenshot_worker(queue_target, worker_id=None, image_folder='image', capture_mode='full',
+                      region_selectors=None, profile_csv='profile.csv', batch_size=5,
+                      lease_seconds=300, login_wait=120, stop_event=None, archive_dir=None,
+                      page_load_strategy=PAGE_LOAD_STRATEGY, navigation_deadline=NAVIGATION_DEADLINE,
+                      proxy_pool=None, pause_seconds=2):
+    """從共用工作佇列領取 URL 進行截圖（可在多台機器上同時執行）
+
+    queue_target 為佇列資料庫路徑或 coordinator 網址（http://host:port）。
+    每次領取 batch_size 筆並持有 lease_seconds 秒的租約，處理期間背景執行緒
+    定期送出心跳；worker 中斷時租約到期，其他 worker 會重新領取這些 URL
+    archive_dir 為封存資料夾（每個 worker 需使用各自的資料夾）
+    page_load_strategy 與 navigation_deadline 同 screenshot_instagram_pages
+    設定 proxy_pool（proxy_pool.ProxyPool）時會分配一個代理給這個 worker，並回報每筆的
+    結果與耗時；代理被封鎖而進入冷卻或停用時，worker 交回未處理的租約並結束
+    每筆之間暫停 pause_seconds 秒（遇到頻率限制時暫停 RATE_LIMIT_PAUSE 秒）
+    """
+    from workqueue import queue_call
+
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+    stop_event = stop_event or threading.Event()
+    os.makedirs(image_folder, exist_ok=True)
+
+    proxy = None
+    if proxy_pool is not None:
+        proxy = proxy_pool.acquire(worker_id)
+        if proxy is None:
+            print(f"[{worker_id}] 沒有可用的代理，worker 不啟動")
+            return
+        print(f"[{worker_id}] 使用代理: {proxy}")
+
+    driver = None
+    profile_rows = []
+    status_counts = {}
+    proxy_blocked = False
+
+    try:
+        driver = setup_driver(page_load_strategy=page_load_strategy, proxy=proxy)
+        navigate(driver, "https://www.instagram.com/", deadline=navigation_deadline)
+        first_tab_handle = driver.current_window_handle
+        print(f"\n[{worker_id}] 請在 {login_wait} 秒內手動登入 Instagram...")
+        stop_event.wait(login_wait)
+
+        while not stop_event.is_set():
+            urls = queue_call(queue_target, 'claim', worker_id=worker_id,
+                              batch_size=batch_size, lease_seconds=lease_seconds)
+            if not urls:
+                stats = queue_call(queue_target, 'stats')
+                if stats['leased'] == 0 and stats['waiting'] == 0:
+                    print(f"[{worker_id}] 佇列已無工作")
+                    break
+                # 其他 worker 仍持有租約或有等待重試的工作，稍後再領取
+                stop_event.wait(min(30, lease_seconds / 3))
+                continue
+
+            # 背景心跳：在處理這批 URL 期間持續延長租約
+            pending = set(urls)
+            batch_done = threading.Event()
+
+            def send_heartbeats():
+                while not batch_done.wait(lease_seconds / 3):
+                    try:
+                        queue_call(queue_target, 'heartbeat', worker_id=worker_id,
+                                   urls=list(pending), lease_seconds=lease_seconds)
+                    except Exception as e:
+                        print(f"[{worker_id}] 送出心跳時發生錯誤: {e}")
+
+            heartbeat_thread = threading.Thread(target=send_heartbeats, daemon=True)
+            heartbeat_thread.start()
+
+            try:
+                for url in urls:
+                    if stop_event.is_set():
+                        break
+                    username = extract_username_from_url(url)
+                    item_started_at = time.time()
+                    if not username:
+                        status = STATUS_NOT_FOUND
+                    else:
+                        print(f"\n[{worker_id}] 處理: {url}")
+                        try:
+                            driver.switch_to.new_window('tab')
+                            status = capture_profile(
+                                driver, url, username, image_folder, capture_mode,
+                                region_selectors, profile_rows if profile_csv else None,
+                                archive_dir=archive_dir, deadline=navigation_deadline
+                            )
+                        except TimeoutException:
+                            status = STATUS_TIMEOUT
+                        except Exception as e:
+                            print(f"處理 {url} 時發生錯誤: {e}")
+                            status = STATUS_ERROR
+                        close_extra_tabs(driver, first_tab_handle)
+
+                    status_counts[status] = status_counts.get(status, 0) + 1
+                    if not queue_call(queue_target, 'complete', worker_id=worker_id, url=url, status=status):
+                        print(f"[{worker_id}] 警告：{url} 的租約已失效，結果未寫入佇列")
+                    pending.discard(url)
+
+                    if profile_csv and len(profile_rows) >= PROFILE_BATCH_SIZE:
+                        flush_profile_rows(profile_csv, profile_rows)
+
+                    if proxy and not proxy_pool.record(proxy, status, time.time() - item_started_at):
+                        proxy_blocked = True
+                        break
+
+                    stop_event.wait(RATE_LIMIT_PAUSE if status == STATUS_RATE_LIMITED else pause_seconds)
+            finally:
+                batch_done.set()
+                heartbeat_thread.join()
+                # 提前結束時立即交回未處理的租約，讓其他 worker 接手
+                if pending:
+                    queue_call(queue_target, 'release', worker_id=worker_id, urls=list(pending))
+
+            if proxy_blocked:
+                print(f"[{worker_id}] 代理 {proxy} 已無法使用，結束 worker")
+                break
+
+        print(f"[{worker_id}] 結果分類: {status_counts}")
+    finally:
+        if proxy:
+            proxy_pool.release(proxy)
+        if profile_csv:
+            flush_profile_rows(profile_csv, profile_rows)
+        if driver:
+            driver.quit()
+            print(f"[{worker_id}] 瀏覽器已關閉")
+
+
 def main():
     """主函數"""
     csv_filename = 'link.csv'
     image_folder = 'image'
+    capture_mode = 'full'  # 'full' 長截圖，'region' 只截取標頭與貼文格狀區
+    refresh_days = None  # 已完成的帳號超過幾天重新截圖（None 表示不重新截圖）
     
     print("開始 Instagram 頁面截圖任務...")
-    screenshot_instagram_pages(csv_filename, image_folder)
+    screenshot_instagram_pages(csv_filename, image_folder, capture_mode, refresh_days=refresh_days)
 
 
 if __name__ == "__main__":
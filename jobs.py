@@ -0,0 +1,272 @@
+"""
+工作執行器
+以 JSON 工作設定描述一次完整的任務（搜尋條件、輸出位置、worker 數量、速率與截圖模式），
+依序執行連結爬取與截圖；每個工作使用各自的資料夾與佇列，可同時執行多個工作
+中斷（Ctrl+C 或 SIGTERM）時會完成目前項目並交回租約，以相同設定重新執行即可從中斷處繼續
+
+使用方式：python jobs.py job.json [其他工作.json ...]
+"""
+
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from contextlib import closing
+from urllib.parse import urlencode
+
+from crawler import harvest_links
+from image import screenshot_worker
+from navigation import PAGE_LOAD_STRATEGY, PAGE_LOAD_STRATEGIES, NAVIGATION_DEADLINE
+from workqueue import DEFAULT_LEASE_SECONDS, open_queue, enqueue_from_csv, queue_call, export_done_to_csv
+
+
+SEARCH_URL = "https://app.kolr.ai/search"
+
+# 工作設定的預設值；output 中的相對路徑以 output.dir 為基準（預設 jobs/<name>）
+JOB_DEFAULTS = {
+    'output': {
+        'dir': None,
+        'csv': 'link.csv',
+        'image_folder': 'image',
+        'profile_csv': 'profile.csv',
+        'archive_dir': None,
+    },
+    'harvest': {
+        'enabled': True,
+        'url': None,          # 直接指定搜尋網址，或以 filters 組成
+        'filters': {
+            'country_code': 'tw',
+            'filter_kol_type': 'all',
+            'mode': 'kol',
+            'platform_type': 'ig',
+            'sort': 'followerCount',
+        },
+        'max_pages': 1000,
+        'incremental': False,
+        'stop_after_known_pages': None,  # 增量模式連續幾頁沒有新帳號就提前結束（不算爬完），預設走完所有頁面
+        'known_pattern': None,  # 預設為輸出資料夾中的 link*.csv
+        'record_dir': None,
+    },
+    'capture': {
+        'enabled': True,
+        'mode': 'full',
+        'workers': 1,
+        'queue': None,        # 預設為輸出資料夾中的 queue.db，也可指定 coordinator 網址
+        'batch_size': 5,
+        'lease_seconds': DEFAULT_LEASE_SECONDS,
+        'login_wait': 120,
+        'pause_seconds': 2,
+        'page_load_strategy': PAGE_LOAD_STRATEGY,
+        'navigation_deadline': NAVIGATION_DEADLINE,
+        'proxies': None,      # 代理清單檔案（見 proxy_pool.py）
+    },
+}
+
+JOB_STATE_FILE = 'job_state.json'
+
+
+def load_job_spec(spec_filename):
+    """讀取工作設定並套用預設值，設定有誤時拋出 ValueError"""
+    with open(spec_filename, 'r', encoding='utf-8') as f:
+        raw = json.load(f)
+
+    name = raw.get('name') or os.path.splitext(os.path.basename(spec_filename))[0]
+    spec = {'name': name}
+    for section, defaults in JOB_DEFAULTS.items():
+        values = raw.get(section) or {}
+        unknown = set(values) - set(defaults)
+        if unknown:
+            raise ValueError(f"{section} 有未知的設定: {', '.join(sorted(unknown))}")
+        spec[section] = {**defaults, **values}
+    # 搜尋條件以預設條件為基礎合併
+    spec['harvest']['filters'] = {
+        **JOB_DEFAULTS['harvest']['filters'],
+        **((raw.get('harvest') or {}).get('filters') or {}),
+    }
+
+    capture = spec['capture']
+    if capture['mode'] not in ('full', 'region'):
+        raise ValueError(f"不支援的截圖模式: {capture['mode']}")
+    if capture['page_load_strategy'] not in PAGE_LOAD_STRATEGIES:
+        raise ValueError(f"不支援的載入策略: {capture['page_load_strategy']}")
+    if int(capture['workers']) < 1:
+        raise ValueError("capture.workers 至少為 1")
+
+    # 解析輸出路徑
+    output = spec['output']
+    output['dir'] = output['dir'] or os.path.join('jobs', name)
+    for key in ('csv', 'image_folder', 'profile_csv', 'archive_dir'):
+        if output[key]:
+            output[key] = os.path.join(output['dir'], output[key])
+    capture['queue'] = capture['queue'] or os.path.join(output['dir'], 'queue.db')
+    harvest = spec['harvest']
+    harvest['known_pattern'] = harvest['known_pattern'] or os.path.join(output['dir'], 'link*.csv')
+    harvest['url'] = harvest['url'] or f"{SEARCH_URL}?{urlencode(harvest['filters'])}"
+    return spec
+
+
+def load_job_state(output_dir):
+    path = os.path.join(output_dir, JOB_STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_job_state(output_dir, state):
+    """以暫存檔加 os.replace 的方式寫回工作進度"""
+    path = os.path.join(output_dir, JOB_STATE_FILE)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def worker_path(path, index, workers):
+    """多個 worker 時為各自的輸出加上編號（例如 profile-2.csv），避免同時寫入同一個檔案"""
+    if not path or workers == 1:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}-{index}{ext}"
+
+
+def run_harvest(spec, state, stop_event):
+    """執行連結爬取，完整爬完時返回 True"""
+    harvest = spec['harvest']
+    output = spec['output']
+    incremental = harvest['incremental']
+    stop_after_known_pages = harvest['stop_after_known_pages']
+    if state.get('harvest_started_at') and os.path.exists(output['csv']):
+        # 上次爬到一半：重新走過搜尋頁，但只寫入新帳號，且不因連續已知帳號而提前結束
+        print("從上次中斷處繼續爬取，已寫入的帳號會略過")
+        incremental = True
+        stop_after_known_pages = None
+
+    state['harvest_started_at'] = state.get('harvest_started_at') or time.time()
+    save_job_state(output['dir'], state)
+    completed = harvest_links(
+        harvest['url'], output['csv'], harvest['max_pages'], harvest['record_dir'],
+        incremental, harvest['known_pattern'], stop_after_known_pages, stop_event,
+    )
+    if completed:
+        state['harvest_done_at'] = time.time()
+        save_job_state(output['dir'], state)
+    return completed
+
+
+def run_capture(spec, state, stop_event):
+    """將 CSV 中未完成的 URL 加入佇列，並以 capture.workers 個 worker 截圖，全部完成時返回 True"""
+    capture = spec['capture']
+    output = spec['output']
+    queue_target = capture['queue']
+    workers = int(capture['workers'])
+
+    if not queue_target.startswith('http'):
+        with closing(open_queue(queue_target)) as conn:
+            enqueue_from_csv(conn, output['csv'])
+
+    proxy_pool = None
+    if capture['proxies']:
+        from proxy_pool import ProxyPool, load_proxies
+        proxy_pool = ProxyPool(load_proxies(capture['proxies']),
+                               os.path.join(output['dir'], 'proxy_stats.csv'))
+
+    threads = []
+    for index in range(1, workers + 1):
+        kwargs = dict(
+            worker_id=f"{spec['name']}-{index}",
+            image_folder=output['image_folder'],
+            capture_mode=capture['mode'],
+            profile_csv=worker_path(output['profile_csv'], index, workers),
+            batch_size=capture['batch_size'],
+            lease_seconds=capture['lease_seconds'],
+            login_wait=capture['login_wait'],
+            stop_event=stop_event,
+            archive_dir=worker_path(output['archive_dir'], index, workers),
+            page_load_strategy=capture['page_load_strategy'],
+            navigation_deadline=capture['navigation_deadline'],
+            proxy_pool=proxy_pool,
+            pause_seconds=capture['pause_seconds'],
+        )
+        thread = threading.Thread(target=screenshot_worker, args=(queue_target,), kwargs=kwargs,
+                                  name=kwargs['worker_id'])
+        thread.start()
+        threads.append(thread)
+
+    # 以逾時的 join 等待，讓主執行緒仍能處理中斷訊號
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(1)
+
+    export_done_to_csv(queue_target, output['csv'])
+    stats = queue_call(queue_target, 'stats')
+    print(f"佇列狀態: {stats}")
+    completed = stats['pending'] == 0 and stats['leased'] == 0 and stats['waiting'] == 0
+    if completed:
+        state['capture_done_at'] = time.time()
+        save_job_state(output['dir'], state)
+    return completed
+
+
+def install_stop_handler(stop_event):
+    """第一次 Ctrl+C / SIGTERM 要求安全停止，第二次立即中斷"""
+    def handle(signum, frame):
+        if stop_event.is_set():
+            raise KeyboardInterrupt
+        print("\n收到停止要求，完成目前項目後結束（再按一次 Ctrl+C 立即中斷）...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, handle)
+    signal.signal(signal.SIGTERM, handle)
+
+
+def run_job(spec_filename, stop_event=None):
+    """執行一個工作設定，所有階段都完成時返回 True"""
+    spec = load_job_spec(spec_filename)
+    output = spec['output']
+    os.makedirs(output['dir'], exist_ok=True)
+    os.makedirs(output['image_folder'], exist_ok=True)
+    state = load_job_state(output['dir'])
+    stop_event = stop_event or threading.Event()
+
+    print(f"\n{'='*50}")
+    print(f"工作: {spec['name']}（輸出: {output['dir']}）")
+    print(f"{'='*50}")
+
+    if spec['harvest']['enabled'] and not state.get('harvest_done_at'):
+        if not run_harvest(spec, state, stop_event):
+            print("連結爬取未完成，之後以相同設定重新執行即可繼續")
+            return False
+    elif spec['harvest']['enabled']:
+        print("連結爬取已於先前完成，略過")
+
+    if stop_event.is_set():
+        return False
+    if spec['capture']['enabled']:
+        if not os.path.exists(output['csv']):
+            print(f"找不到連結檔案: {output['csv']}")
+            return False
+        if not run_capture(spec, state, stop_event):
+            print("截圖尚未全部完成，之後以相同設定重新執行即可繼續")
+            return False
+
+    print(f"工作 {spec['name']} 已完成")
+    return True
+
+
+def main():
+    """主函數：依序執行命令列指定的工作設定（預設為 job.json）"""
+    spec_filenames = sys.argv[1:] or ['job.json']
+    stop_event = threading.Event()
+    install_stop_handler(stop_event)
+
+    for spec_filename in spec_filenames:
+        if stop_event.is_set():
+            break
+        run_job(spec_filename, stop_event)
+
+
+if __name__ == "__main__":
+    main()
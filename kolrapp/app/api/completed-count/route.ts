@@ -1,6 +1,7 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
+import { loadReviewMeta, parseCsvRows } from '@/app/lib/reviewIndex';
 
 export async function GET() {
   try {
@@ -14,6 +15,15 @@ export async function GET() {
       );
     }
     
+    // 有最新的審核索引時直接使用預先計算的數量
+    const meta = loadReviewMeta(csvPath);
+    if (meta) {
+      return NextResponse.json({
+        completedCount: meta.completed,
+        total: meta.total
+      });
+    }
+    
     const csvContent = fs.readFileSync(csvPath, 'utf-8');
     
     // 解析 CSV
@@ -26,25 +36,13 @@ export async function GET() {
       );
     }
     
-    // 跳過標題行，計算 image_done 為 true 的筆數
-    let completedCount = 0;
-    for (let i = 1; i < lines.length; i++) {
-      const line = lines[i].trim();
-      if (!line) continue;
-      
-      // 處理 CSV：分割第一個逗號
-      const firstCommaIndex = line.indexOf(',');
-      if (firstCommaIndex !== -1) {
-        const image_done = line.substring(firstCommaIndex + 1).trim().toLowerCase();
-        if (image_done === 'true') {
-          completedCount++;
-        }
-      }
-    }
+    // 跳過標題行，計算 image_done 為 true 的筆數（資料列的判斷與審核索引相同）
+    const rows = parseCsvRows(lines);
+    const completedCount = rows.filter(row => row.image_done.toLowerCase() === 'true').length;
     
     return NextResponse.json({
       completedCount,
-      total: lines.length - 1 // 減去標題行
+      total: rows.length
     });
   } catch (error) {
     console.error('讀取 CSV 錯誤:', error);
@@ -1,17 +1,21 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
-
-interface CSVRow {
-  link: string;
-  image_done: string;
-  index: number;
-}
+import {
+  PENDING_WINDOW,
+  loadReviewMeta,
+  findPendingRecord,
+  edgePendingRecord,
+  pendingWindow,
+  parseCsvRows,
+} from '@/app/lib/reviewIndex';
 
 export async function GET(request: Request) {
   try {
     const { searchParams } = new URL(request.url);
     const currentIndex = searchParams.get('index');
+    // 未指定索引時的起始項目：正向為第一個，反向為最後一個
+    const direction = searchParams.get('direction') === 'reverse' ? 'reverse' : 'forward';
     
     // 讀取 CSV 檔案
     const csvPath = path.join(process.cwd(), 'public', 'iglink.csv');
@@ -23,6 +27,35 @@ export async function GET(request: Request) {
       );
     }
     
+    // 有最新的審核索引時只讀取目標項目所在的分頁
+    const meta = loadReviewMeta(csvPath);
+    if (meta) {
+      let found = currentIndex !== null ? findPendingRecord(meta, parseInt(currentIndex, 10)) : null;
+      if (!found) {
+        found = edgePendingRecord(meta, direction);
+      }
+      if (!found) {
+        return NextResponse.json({
+          currentIndex: -1,
+          currentUrl: null,
+          total: 0,
+          urls: [],
+          pendingIndices: [],
+          currentPosition: 0,
+          message: '沒有未完成的項目'
+        });
+      }
+      
+      return NextResponse.json({
+        currentIndex: found.record.index,
+        currentUrl: found.record.link,
+        total: meta.pending,
+        urls: [], // 索引模式不回傳完整網址列表，需要時依分頁讀取
+        pendingIndices: pendingWindow(meta, found.record.index), // 只回傳前後鄰近的項目
+        currentPosition: found.position + 1
+      });
+    }
+    
     const csvContent = fs.readFileSync(csvPath, 'utf-8');
     
     // 解析 CSV
@@ -44,27 +77,11 @@ export async function GET(request: Request) {
       );
     }
     
-    // 解析所有行
-    const rows: CSVRow[] = [];
-    for (let i = 1; i < lines.length; i++) {
-      const line = lines[i].trim();
-      if (!line) continue;
-      
-      // 處理 CSV：分割第一個逗號
-      const firstCommaIndex = line.indexOf(',');
-      if (firstCommaIndex === -1) {
-        // 沒有逗號，只有 link
-        rows.push({ link: line, image_done: '', index: i - 1 });
-      } else {
-        const link = line.substring(0, firstCommaIndex).trim();
-        const image_done = line.substring(firstCommaIndex + 1).trim();
-        rows.push({ link, image_done, index: i - 1 });
-      }
-    }
+    // 解析所有行（列索引與審核索引相同）
+    const rows = parseCsvRows(lines);
     
     // 找到所有未完成的項目（image_done 為空）
     const pendingRows = rows.filter(row => !row.image_done || row.image_done === '');
-    const pendingUrls = pendingRows.map(row => row.link);
     
     if (pendingRows.length === 0) {
       return NextResponse.json({
@@ -78,8 +95,8 @@ export async function GET(request: Request) {
       });
     }
     
-    // 如果提供了索引，使用該索引；否則使用第一個未完成項目的索引
-    let targetIndex = 0;
+    // 如果提供了索引，使用該索引；否則依方向使用第一個或最後一個未完成項目的索引
+    let targetIndex = direction === 'forward' ? 0 : pendingRows.length - 1;
     if (currentIndex !== null) {
       const index = parseInt(currentIndex, 10);
       const foundIndex = pendingRows.findIndex(row => row.index === index);
@@ -90,14 +107,18 @@ export async function GET(request: Request) {
     
     const currentRow = pendingRows[targetIndex];
     
-    // 返回所有未完成項目的索引列表，方便導航
-    const pendingIndices = pendingRows.map(row => row.index);
+    // 返回前後鄰近未完成項目的索引列表，方便導航
+    const windowRows = pendingRows.slice(
+      Math.max(targetIndex - PENDING_WINDOW, 0),
+      targetIndex + PENDING_WINDOW + 1
+    );
+    const pendingIndices = windowRows.map(row => row.index);
     
     return NextResponse.json({
       currentIndex: currentRow.index,
       currentUrl: currentRow.link,
       total: pendingRows.length,
-      urls: pendingUrls,
+      urls: windowRows.map(row => row.link),
       pendingIndices: pendingIndices,
       currentPosition: targetIndex + 1
     });
@@ -1,6 +1,7 @@
 import { NextResponse } from 'next/server';
 import fs from 'fs';
 import path from 'path';
+import { loadReviewMeta, applyReview, nextPendingAfter, parseCsvRows } from '@/app/lib/reviewIndex';
 
 export async function POST(request: Request) {
   try {
@@ -24,82 +25,52 @@ export async function POST(request: Request) {
       );
     }
     
+    // 審核索引需在寫回 CSV 之前讀取（寫回後 CSV 會比索引新）
+    const meta = loadReviewMeta(csvPath);
+    
     const csvContent = fs.readFileSync(csvPath, 'utf-8');
     
     // 解析 CSV
     const lines = csvContent.split('\n');
-    const headers = lines[0];
-    
-    // 更新對應行的 image_done 欄位
-    let updated = false;
-    const updatedLines = lines.map((line, index) => {
-      if (index === 0) return line; // 跳過標題行
-      
-      const trimmedLine = line.trim();
-      if (!trimmedLine) return line;
-      
-      // 處理 CSV：分割第一個逗號
-      const firstCommaIndex = trimmedLine.indexOf(',');
-      if (firstCommaIndex === -1) {
-        // 沒有逗號，只有 link
-        if (trimmedLine === url) {
-          updated = true;
-          return `${url},${status}`;
-        }
-        return line;
-      } else {
-        const link = trimmedLine.substring(0, firstCommaIndex).trim();
-        const image_done = trimmedLine.substring(firstCommaIndex + 1).trim();
-        
-        if (link === url) {
-          updated = true;
-          return `${link},${status}`;
-        }
-      }
-      return line;
-    });
+    const rows = parseCsvRows(lines);
     
-    if (!updated) {
+    // 更新對應行的 image_done 欄位，並記錄該行的列索引與原本的值
+    const matched = rows.filter(row => row.link === url);
+    if (matched.length === 0) {
       return NextResponse.json(
         { error: '找不到對應的 URL' },
         { status: 404 }
       );
     }
+    const rowIndex = matched[0].index;
+    const previousValue = matched[0].image_done;
+    const updatedLines = [...lines];
+    for (const row of matched) {
+      updatedLines[row.line] = `${row.link},${status}`;
+      row.image_done = String(status).trim();
+    }
     
     // 寫回檔案
     fs.writeFileSync(csvPath, updatedLines.join('\n'), 'utf-8');
     
-    // 找到下一個未完成的項目
-    const pendingRows: { link: string; index: number }[] = [];
-    updatedLines.forEach((line, index) => {
-      if (index === 0) return; // 跳過標題行
-      
-      const trimmedLine = line.trim();
-      if (!trimmedLine) return;
-      
-      const firstCommaIndex = trimmedLine.indexOf(',');
-      if (firstCommaIndex === -1) {
-        // 沒有逗號，只有 link（視為未完成）
-        pendingRows.push({ link: trimmedLine, index: index - 1 });
-      } else {
-        const link = trimmedLine.substring(0, firstCommaIndex).trim();
-        const image_done = trimmedLine.substring(firstCommaIndex + 1).trim();
-        
-        if (!image_done || image_done === '') {
-          pendingRows.push({ link, index: index - 1 });
-        }
+    // 有審核索引時直接修補索引並從中找下一個項目，不需重新解析整份 CSV
+    // （同一網址出現多次時不修補，讓索引失效改用 CSV）
+    if (meta && matched.length === 1) {
+      const patched = applyReview(meta, csvPath, rowIndex, previousValue, String(status).trim());
+      if (patched) {
+        const next = nextPendingAfter(patched, rowIndex);
+        return NextResponse.json({
+          success: true,
+          nextIndex: next ? next.index : null,
+          nextUrl: next ? next.link : null,
+          remaining: patched.pending
+        });
       }
-    });
-    
-    // 找到當前 URL 的索引，然後找下一個
-    const currentRowIndex = updatedLines.findIndex((line, index) => {
-      if (index === 0) return false;
-      const match = line.match(/^(.+?),(.*)$/);
-      return match && match[1].trim() === url;
-    }) - 1;
+    }
     
-    // 找到下一個未完成的項目（在當前項目之後）
-    const nextPending = pendingRows.find(row => row.index > currentRowIndex);
+    // 找到下一個未完成的項目（在當前項目之後），列索引與審核索引相同
+    const pendingRows = rows.filter(row => !row.image_done);
+    const nextPending = pendingRows.find(row => row.index > rowIndex);
     
     return NextResponse.json({
       success: true,
@@ -0,0 +1,255 @@
+import fs from 'fs';
+import path from 'path';
+
+// 由 Python 端 capture_state.publish_review_index 產生的審核索引
+export interface ReviewMeta {
+  version: string;
+  source: string;
+  source_mtime: number;
+  generated_at: number;
+  total: number;
+  completed: number;
+  pending: number;
+  page_size: number;
+  pages: number;
+  page_first_index: number[];
+  page_counts: number[];
+}
+
+export interface PendingRecord {
+  index: number;
+  link: string;
+}
+
+export type SearchDirection = 'forward' | 'reverse';
+
+export interface CsvRow {
+  link: string;
+  image_done: string;
+  index: number; // 列索引（與審核索引相同）
+  line: number; // 在原始檔案中的行號（從 0 起算，0 為標題行）
+}
+
+export const reviewIndexDir = path.join(process.cwd(), 'public', 'review_index');
+
+// 回傳給前端的鄰近待處理項目數量（前後各幾筆），用於上一個 / 下一個導航
+export const PENDING_WINDOW = 20;
+
+function writeJsonAtomic(filePath: string, data: unknown) {
+  const tmpPath = `${filePath}.${process.pid}.tmp`;
+  fs.writeFileSync(tmpPath, JSON.stringify(data), 'utf-8');
+  fs.renameSync(tmpPath, filePath);
+}
+
+// 解析連結 CSV 的資料列，列索引規則與 capture_state.publish_review_index 相同：
+// 略過標題行與連結欄為空的行（空白行、只有逗號的行），其餘依序從 0 起算
+export function parseCsvRows(lines: string[]): CsvRow[] {
+  const rows: CsvRow[] = [];
+  for (let i = 1; i < lines.length; i++) {
+    const line = lines[i].trim();
+    const firstCommaIndex = line.indexOf(',');
+    const link = (firstCommaIndex === -1 ? line : line.substring(0, firstCommaIndex)).trim();
+    if (!link) continue;
+    const image_done = firstCommaIndex === -1 ? '' : line.substring(firstCommaIndex + 1).trim();
+    rows.push({ link, image_done, index: rows.length, line: i });
+  }
+  return rows;
+}
+
+function csvMtime(csvPath: string): number {
+  return fs.statSync(csvPath).mtimeMs / 1000;
+}
+
+const metaPath = path.join(reviewIndexDir, 'meta.json');
+
+// 讀取索引資訊；索引不存在、格式過舊或比 CSV 舊時返回 null，改用 CSV
+export function loadReviewMeta(csvPath: string): ReviewMeta | null {
+  if (!fs.existsSync(metaPath) || !fs.existsSync(csvPath)) {
+    return null;
+  }
+
+  try {
+    const meta: ReviewMeta = JSON.parse(fs.readFileSync(metaPath, 'utf-8'));
+    if (!Array.isArray(meta.page_counts)) {
+      return null;
+    }
+    if (csvMtime(csvPath) > meta.source_mtime + 0.001) {
+      return null;
+    }
+    return meta;
+  } catch {
+    return null;
+  }
+}
+
+function pagePath(meta: ReviewMeta, page: number): string {
+  return path.join(reviewIndexDir, meta.version, `pending-${String(page).padStart(5, '0')}.json`);
+}
+
+// 讀取指定分頁的待處理項目
+export function readPendingPage(meta: ReviewMeta, page: number): PendingRecord[] {
+  if (meta.page_counts[page] === 0) {
+    return [];
+  }
+  return JSON.parse(fs.readFileSync(pagePath(meta, page), 'utf-8'));
+}
+
+// 以二分搜尋找到列索引所在的分頁
+function locatePage(meta: ReviewMeta, index: number): number {
+  let low = 0;
+  let high = meta.pages - 1;
+  while (low < high) {
+    const mid = Math.ceil((low + high) / 2);
+    if (meta.page_first_index[mid] <= index) {
+      low = mid;
+    } else {
+      high = mid - 1;
+    }
+  }
+  return low;
+}
+
+// 分頁之前的待處理項目數量
+function pageOffset(meta: ReviewMeta, page: number): number {
+  let offset = 0;
+  for (let i = 0; i < page; i++) {
+    offset += meta.page_counts[i];
+  }
+  return offset;
+}
+
+// 依列索引找到待處理項目與其位置（從 0 起算），只讀取該項目所在的分頁
+export function findPendingRecord(
+  meta: ReviewMeta,
+  index: number
+): { record: PendingRecord; position: number } | null {
+  if (meta.pending === 0) {
+    return null;
+  }
+
+  const page = locatePage(meta, index);
+  const records = readPendingPage(meta, page);
+  const offset = records.findIndex(record => record.index === index);
+  if (offset === -1) {
+    return null;
+  }
+  return { record: records[offset], position: pageOffset(meta, page) + offset };
+}
+
+// 第一個（正向）或最後一個（反向）待處理項目
+export function edgePendingRecord(
+  meta: ReviewMeta,
+  direction: SearchDirection
+): { record: PendingRecord; position: number } | null {
+  if (meta.pending === 0) {
+    return null;
+  }
+  if (direction === 'forward') {
+    for (let page = 0; page < meta.pages; page++) {
+      if (meta.page_counts[page] > 0) {
+        return { record: readPendingPage(meta, page)[0], position: 0 };
+      }
+    }
+  } else {
+    for (let page = meta.pages - 1; page >= 0; page--) {
+      if (meta.page_counts[page] > 0) {
+        const records = readPendingPage(meta, page);
+        return { record: records[records.length - 1], position: meta.pending - 1 };
+      }
+    }
+  }
+  return null;
+}
+
+// 列索引 index 前後各 radius 筆待處理項目的列索引（包含 index 本身，若仍待處理）
+export function pendingWindow(meta: ReviewMeta, index: number, radius = PENDING_WINDOW): number[] {
+  if (meta.pending === 0) {
+    return [];
+  }
+
+  const page = locatePage(meta, index);
+  const before: number[] = [];
+  const after: number[] = [];
+  for (const record of readPendingPage(meta, page)) {
+    (record.index < index ? before : after).push(record.index);
+  }
+  for (let p = page - 1; p >= 0 && before.length < radius; p--) {
+    before.unshift(...readPendingPage(meta, p).map(record => record.index));
+  }
+  for (let p = page + 1; p < meta.pages && after.length <= radius; p++) {
+    after.push(...readPendingPage(meta, p).map(record => record.index));
+  }
+  return [...before.slice(-radius), ...after.slice(0, radius + 1)];
+}
+
+// 列索引 index 之後的第一個待處理項目
+export function nextPendingAfter(meta: ReviewMeta, index: number): PendingRecord | null {
+  if (meta.pending === 0) {
+    return null;
+  }
+  for (let page = locatePage(meta, index); page < meta.pages; page++) {
+    const next = readPendingPage(meta, page).find(record => record.index > index);
+    if (next) {
+      return next;
+    }
+  }
+  return null;
+}
+
+// 讀取目前的 meta.json，確認與 meta 是同一份索引（期間沒有重新發布或被其他請求修補）
+function isCurrentMeta(meta: ReviewMeta): boolean {
+  try {
+    const current: ReviewMeta = JSON.parse(fs.readFileSync(metaPath, 'utf-8'));
+    return current.version === meta.version && current.source_mtime === meta.source_mtime;
+  } catch {
+    return false;
+  }
+}
+
+// 審核後直接修補索引（移除該項目、調整數量並以新的 CSV 修改時間寫回 meta.json），
+// 不需重新讀取整份 CSV；無法修補（項目重新變回待處理，或索引已被 Python 端重新發布）時
+// 返回 null，之後改用 CSV
+export function applyReview(
+  meta: ReviewMeta,
+  csvPath: string,
+  index: number,
+  previousValue: string,
+  value: string
+): ReviewMeta | null {
+  const wasPending = previousValue === '';
+  const isPending = value === '';
+  if (!wasPending && isPending) {
+    return null;
+  }
+  // 寫入前再次讀取 meta.json：重新發布後舊版本的分頁可能已被清除，不能以舊的 meta 覆蓋
+  if (!isCurrentMeta(meta)) {
+    return null;
+  }
+
+  const updated: ReviewMeta = {
+    ...meta,
+    page_counts: [...meta.page_counts],
+    completed:
+      meta.completed +
+      (value.toLowerCase() === 'true' ? 1 : 0) -
+      (previousValue.toLowerCase() === 'true' ? 1 : 0),
+  };
+
+  if (wasPending && meta.pending > 0) {
+    const page = locatePage(meta, index);
+    const records = readPendingPage(meta, page);
+    const remaining = records.filter(record => record.index !== index);
+    if (remaining.length !== records.length) {
+      // 清空的分頁保留原本的第一個列索引，二分搜尋仍維持遞增
+      if (remaining.length > 0) {
+        writeJsonAtomic(pagePath(meta, page), remaining);
+      }
+      updated.page_counts[page] = remaining.length;
+      updated.pending = meta.pending - 1;
+    }
+  }
+
+  updated.source_mtime = csvMtime(csvPath);
+  writeJsonAtomic(metaPath, updated);
+  return updated;
+}
@@ -36,31 +36,8 @@ export default function Home() {
       if (index !== undefined) {
         url = `/api/ig-links?index=${index}`;
       } else {
-        // 如果沒有指定索引，先獲取所有未完成項目的列表
-        const listResponse = await fetch('/api/ig-links');
-        if (listResponse.ok) {
-          const listResult = await listResponse.json();
-          if (listResult.pendingIndices && listResult.pendingIndices.length > 0) {
-            // 正向：第一個，反向：最後一個
-            const targetIndex = dir === 'forward' 
-              ? listResult.pendingIndices[0]
-              : listResult.pendingIndices[listResult.pendingIndices.length - 1];
-            url = `/api/ig-links?index=${targetIndex}`;
-          } else {
-            // 沒有未完成的項目
-            setData({
-              currentIndex: -1,
-              currentUrl: null,
-              total: 0,
-              urls: [],
-              pendingIndices: [],
-              currentPosition: 0
-            });
-            setCurrentPosition(0);
-            setLoading(false);
-            return;
-          }
-        }
+        // 沒有指定索引時由 API 依方向回傳起始項目（正向：第一個，反向：最後一個）
+        url = `/api/ig-links?direction=${dir}`;
       }
       
       const response = await fetch(url);
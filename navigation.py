@@ -0,0 +1,94 @@
+"""
+頁面導覽
+以 eager/none 載入策略搭配每次導覽的時間上限：不等待第三方資源全部載入，
+頁面可用就繼續；超過上限時停止載入並重試，全部失敗就交回呼叫端處理
+"""
+
+import json
+import time
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+
+# 載入策略：normal 等待所有資源、eager 只等到 DOMContentLoaded、none 不等待
+PAGE_LOAD_STRATEGY = 'eager'
+PAGE_LOAD_STRATEGIES = ('normal', 'eager', 'none')
+
+# 每次導覽（含等待頁面可用）的秒數上限，以及逾時後的重試次數
+NAVIGATION_DEADLINE = 20
+NAVIGATION_RETRIES = 1
+READY_POLL_INTERVAL = 0.25
+
+
+def set_page_load_strategy(chrome_options, strategy=PAGE_LOAD_STRATEGY):
+    """在 Chrome 選項中設定載入策略"""
+    if strategy not in PAGE_LOAD_STRATEGIES:
+        raise ValueError(f"不支援的載入策略: {strategy}（可用: {', '.join(PAGE_LOAD_STRATEGIES)}）")
+    chrome_options.page_load_strategy = strategy
+    return chrome_options
+
+
+def ready_script(selector=None, texts=None):
+    """產生判斷頁面可用的腳本：找到 selector 元素或頁面已完全載入
+
+    提供 texts 時改為找到 selector 元素，或頁面文字 / 網址包含 texts 中任一字串，
+    不以 readyState 判斷：單頁應用載入完成時錯誤訊息等內容可能還沒渲染出來
+    """
+    conditions = []
+    if selector:
+        conditions.append(f"!!document.querySelector({json.dumps(selector)})")
+    if texts:
+        conditions.append(
+            f"{json.dumps(list(texts), ensure_ascii=False)}.some(s => location.href.includes(s) "
+            f"|| (document.body && document.body.innerText.includes(s)))"
+        )
+    else:
+        conditions.append("document.readyState === 'complete'")
+    return f"return {' || '.join(conditions)};"
+
+
+def stop_loading(driver):
+    """停止目前頁面的載入，讓後續指令不必等待未完成的資源"""
+    try:
+        driver.execute_script("window.stop();")
+    except WebDriverException:
+        pass
+
+
+def wait_until_ready(driver, script, timeout):
+    """在 timeout 秒內輪詢 script，返回頁面是否已可用"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if driver.execute_script(script):
+                return True
+        except WebDriverException:
+            pass  # 導覽過程中文件可能還不存在
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(READY_POLL_INTERVAL)
+
+
+def navigate(driver, url, selector=None, deadline=NAVIGATION_DEADLINE, retries=NAVIGATION_RETRIES,
+             texts=None):
+    """開啟 url 並在 deadline 秒內等待頁面可用（出現 selector 元素或載入完成，見 ready_script）
+
+    逾時就停止載入並重試，最多重試 retries 次；成功返回 True，全部逾時返回 False
+    """
+    script = ready_script(selector, texts)
+    for attempt in range(retries + 1):
+        started = time.monotonic()
+        driver.set_page_load_timeout(deadline)
+        try:
+            driver.get(url)
+        except TimeoutException:
+            stop_loading(driver)
+            print(f"頁面載入超過 {deadline} 秒（第 {attempt + 1}/{retries + 1} 次）: {url}")
+            continue
+
+        remaining = max(deadline - (time.monotonic() - started), 0)
+        if wait_until_ready(driver, script, remaining):
+            return True
+        stop_loading(driver)
+        print(f"頁面在 {deadline} 秒內未就緒（第 {attempt + 1}/{retries + 1} 次）: {url}")
+    return False
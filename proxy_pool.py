@@ -0,0 +1,326 @@
+"""
+代理池
+為每個瀏覽器 / worker 分配代理，記錄每個代理的成功率與延遲（指數移動平均），
+被封鎖的代理先冷卻一段時間，連續被封鎖或成功率過低時停用；統計保存在 proxy_stats.csv
+proxies.txt 每行一個代理（例如 http://10.0.0.1:3128、socks5://10.0.0.2:1080）
+注意：Chrome 的 --proxy-server 不支援帳號密碼，需要驗證的代理請改用 IP 白名單
+"""
+
+import csv
+import os
+import select
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from capture_state import (
+    STATUS_OK, STATUS_NOT_FOUND, STATUS_RATE_LIMITED, STATUS_ERROR, DONE_STATUSES,
+)
+
+
+PROXY_LIST_FILE = 'proxies.txt'
+PROXY_STATS_FILE = 'proxy_stats.csv'
+PROXY_STATS_FIELDS = [
+    'proxy', 'successes', 'failures', 'blocks', 'consecutive_blocks',
+    'latency_ewma', 'cooldown_until', 'retired', 'last_used_at',
+]
+
+# 代理正常運作的結果（頁面不存在也代表請求有送達）與被封鎖的結果（429 或驗證頁面）
+# 登入牆是登入狀態失效，與代理無關，只計入失敗，不讓代理冷卻
+PROXY_OK_STATUSES = DONE_STATUSES | {STATUS_NOT_FOUND}
+PROXY_BLOCKED_STATUSES = {STATUS_RATE_LIMITED}
+
+LATENCY_ALPHA = 0.2
+DEFAULT_LATENCY = 5.0        # 尚無實測值時假設的每筆秒數（讓新代理有機會被選到）
+
+# 第 n 次連續被封鎖後冷卻 base * 2^(n-1) 秒（上限 COOLDOWN_MAX），連續 RETIRE_AFTER_BLOCKS 次停用
+COOLDOWN_BASE = 600
+COOLDOWN_MAX = 6 * 3600
+RETIRE_AFTER_BLOCKS = 4
+# 至少 RETIRE_MIN_SAMPLES 筆紀錄且成功率低於 RETIRE_SUCCESS_RATE 時停用
+RETIRE_MIN_SAMPLES = 10
+RETIRE_SUCCESS_RATE = 0.2
+
+CHECK_URL = 'https://www.instagram.com/'
+
+
+def load_proxies(filename=PROXY_LIST_FILE):
+    """讀取代理清單（忽略空行與 # 開頭的註解）"""
+    if not os.path.exists(filename):
+        return []
+    with open(filename, 'r', encoding='utf-8') as f:
+        return [line.strip() for line in f if line.strip() and not line.strip().startswith('#')]
+
+
+def new_proxy_stats(proxy):
+    return {
+        'proxy': proxy, 'successes': 0, 'failures': 0, 'blocks': 0, 'consecutive_blocks': 0,
+        'latency_ewma': 0.0, 'cooldown_until': 0.0, 'retired': False, 'last_used_at': 0.0,
+    }
+
+
+def load_proxy_stats(filename=PROXY_STATS_FILE):
+    """讀取代理統計，返回 {proxy: stats}"""
+    stats = {}
+    if not os.path.exists(filename):
+        return stats
+    try:
+        with open(filename, 'r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if not row.get('proxy'):
+                    continue
+                entry = new_proxy_stats(row['proxy'])
+                for field in ('successes', 'failures', 'blocks', 'consecutive_blocks'):
+                    entry[field] = int(row.get(field) or 0)
+                for field in ('latency_ewma', 'cooldown_until', 'last_used_at'):
+                    entry[field] = float(row.get(field) or 0)
+                entry['retired'] = row.get('retired') == 'true'
+                stats[row['proxy']] = entry
+    except Exception as e:
+        print(f"讀取代理統計時發生錯誤: {e}")
+    return stats
+
+
+def save_proxy_stats(filename, stats):
+    """以暫存檔加 os.replace 的方式寫回代理統計"""
+    try:
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=PROXY_STATS_FIELDS)
+            writer.writeheader()
+            for entry in stats.values():
+                writer.writerow({
+                    **entry,
+                    'latency_ewma': f"{entry['latency_ewma']:.2f}",
+                    'cooldown_until': f"{entry['cooldown_until']:.0f}",
+                    'last_used_at': f"{entry['last_used_at']:.0f}",
+                    'retired': 'true' if entry['retired'] else 'false',
+                })
+        os.replace(tmp_path, filename)
+        return True
+    except Exception as e:
+        print(f"寫入代理統計時發生錯誤: {e}")
+        return False
+
+
+def success_rate(entry):
+    """成功率（加一平滑，沒有紀錄時為 0.5）"""
+    total = entry['successes'] + entry['failures'] + entry['blocks']
+    return (entry['successes'] + 1) / (total + 2)
+
+
+def proxy_score(entry):
+    """代理的預估產能：成功率除以每筆秒數（越大越好）"""
+    latency = entry['latency_ewma'] or DEFAULT_LATENCY
+    return success_rate(entry) / max(latency, 0.1)
+
+
+def is_usable(entry, now=None):
+    """代理未停用且不在冷卻中"""
+    now = now or time.time()
+    return not entry['retired'] and entry['cooldown_until'] <= now
+
+
+def update_proxy_stats(entry, status, latency=None, now=None):
+    """依一次截圖結果更新代理統計"""
+    now = now or time.time()
+    entry['last_used_at'] = now
+    if latency is not None:
+        if entry['latency_ewma']:
+            entry['latency_ewma'] = LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * entry['latency_ewma']
+        else:
+            entry['latency_ewma'] = latency
+
+    if status in PROXY_OK_STATUSES:
+        entry['successes'] += 1
+        entry['consecutive_blocks'] = 0
+    elif status in PROXY_BLOCKED_STATUSES:
+        entry['blocks'] += 1
+        entry['consecutive_blocks'] += 1
+        if entry['consecutive_blocks'] >= RETIRE_AFTER_BLOCKS:
+            entry['retired'] = True
+        else:
+            cooldown = min(COOLDOWN_BASE * 2 ** (entry['consecutive_blocks'] - 1), COOLDOWN_MAX)
+            entry['cooldown_until'] = now + cooldown
+    else:
+        entry['failures'] += 1
+
+    total = entry['successes'] + entry['failures'] + entry['blocks']
+    if total >= RETIRE_MIN_SAMPLES and success_rate(entry) < RETIRE_SUCCESS_RATE:
+        entry['retired'] = True
+    return entry
+
+
+class ProxyPool:
+    """可由多個 worker 執行緒共用的代理池"""
+
+    def __init__(self, proxies=None, stats_filename=PROXY_STATS_FILE):
+        self.stats_filename = stats_filename
+        self._lock = threading.Lock()
+        self._stats = load_proxy_stats(stats_filename)
+        self._proxies = list(proxies if proxies is not None else load_proxies())
+        for proxy in self._proxies:
+            self._stats.setdefault(proxy, new_proxy_stats(proxy))
+        self._in_use = {}
+
+    def acquire(self, worker_id):
+        """分配目前產能最高、可用且未被其他 worker 使用的代理，沒有時返回 None"""
+        with self._lock:
+            now = time.time()
+            candidates = [self._stats[proxy] for proxy in self._proxies
+                          if proxy not in self._in_use and is_usable(self._stats[proxy], now)]
+            if not candidates:
+                return None
+            best = max(candidates, key=proxy_score)
+            self._in_use[best['proxy']] = worker_id
+            return best['proxy']
+
+    def release(self, proxy):
+        with self._lock:
+            self._in_use.pop(proxy, None)
+
+    def record(self, proxy, status, latency=None):
+        """記錄一次結果並保存統計，返回代理是否仍可繼續使用"""
+        with self._lock:
+            entry = update_proxy_stats(self._stats[proxy], status, latency)
+            save_proxy_stats(self.stats_filename, self._stats)
+            usable = is_usable(entry)
+        if not usable:
+            state = '已停用' if entry['retired'] else f"冷卻至 {time.strftime('%H:%M:%S', time.localtime(entry['cooldown_until']))}"
+            print(f"代理 {proxy} 被封鎖或失敗過多，{state}")
+        return usable
+
+    def summary(self):
+        """返回各代理統計（依產能排序）"""
+        with self._lock:
+            return sorted((dict(self._stats[proxy]) for proxy in self._proxies),
+                          key=proxy_score, reverse=True)
+
+
+def check_proxy(proxy, url=CHECK_URL, timeout=10):
+    """透過代理請求 url，返回 (是否成功, 秒數, HTTP 狀態碼或錯誤訊息)"""
+    proxy_url = proxy if '://' in proxy else f"http://{proxy}"
+    opener = urllib.request.build_opener(urllib.request.ProxyHandler({'http': proxy_url, 'https': proxy_url}))
+    started = time.time()
+    try:
+        with opener.open(url, timeout=timeout) as response:
+            response.read(1024)
+            return True, time.time() - started, response.status
+    except urllib.error.HTTPError as e:
+        return False, time.time() - started, e.code
+    except Exception as e:
+        return False, time.time() - started, str(e)
+
+
+def check_status(result):
+    """將 check_proxy 的結果轉為結果分類，供 ProxyPool.record 使用"""
+    ok, _, code = result
+    if ok:
+        return STATUS_OK
+    if code == 429:
+        return STATUS_RATE_LIMITED
+    return STATUS_ERROR
+
+
+class LocalProxyHandler(BaseHTTPRequestHandler):
+    """本機測試用的簡易代理：轉送 GET 與 CONNECT，超過 block_after 次請求後回應 429"""
+
+    block_after = None
+    delay = 0.0
+    request_count = 0
+    count_lock = threading.Lock()
+
+    def _blocked(self):
+        with self.count_lock:
+            type(self).request_count += 1
+            count = type(self).request_count
+        time.sleep(self.delay)
+        if self.block_after is not None and count > self.block_after:
+            self.send_error(429, 'Too Many Requests')
+            return True
+        return False
+
+    def do_GET(self):
+        if self._blocked():
+            return
+        try:
+            request = urllib.request.Request(self.path, headers={
+                key: value for key, value in self.headers.items() if key.lower() != 'proxy-connection'
+            })
+            with urllib.request.urlopen(request, timeout=30) as response:
+                body = response.read()
+                status = response.status
+                headers = response.headers
+        except urllib.error.HTTPError as e:
+            body, status, headers = e.read(), e.code, e.headers
+        except Exception as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(status)
+        for key, value in headers.items():
+            if key.lower() not in ('transfer-encoding', 'connection', 'content-length'):
+                self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_CONNECT(self):
+        if self._blocked():
+            return
+        host, _, port = self.path.partition(':')
+        try:
+            upstream = socket.create_connection((host, int(port or 443)), timeout=30)
+        except Exception as e:
+            self.send_error(502, str(e))
+            return
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+        sockets = [self.connection, upstream]
+        try:
+            while True:
+                readable, _, errored = select.select(sockets, [], sockets, 30)
+                if errored or not readable:
+                    break
+                for sock in readable:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    (upstream if sock is self.connection else self.connection).sendall(data)
+        finally:
+            upstream.close()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_local_proxy(host='127.0.0.1', port=8899, block_after=None, delay=0.0):
+    """建立本機測試代理（呼叫 serve_forever 開始服務），可模擬延遲與封鎖"""
+    handler = type('BoundLocalProxyHandler', (LocalProxyHandler,), {
+        'block_after': block_after, 'delay': delay, 'request_count': 0,
+        'count_lock': threading.Lock(),
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    """主函數：檢查 proxies.txt 中的每個代理並更新統計"""
+    pool = ProxyPool(load_proxies(PROXY_LIST_FILE), PROXY_STATS_FILE)
+    for entry in pool.summary():
+        result = check_proxy(entry['proxy'])
+        pool.record(entry['proxy'], check_status(result), result[1])
+        print(f"{entry['proxy']}: {'可用' if result[0] else '失敗'}（{result[1]:.1f} 秒，{result[2]}）")
+
+    print("\n代理統計（依產能排序）:")
+    for entry in pool.summary():
+        state = '停用' if entry['retired'] else ('冷卻中' if not is_usable(entry) else '可用')
+        print(f"{entry['proxy']}: 成功率 {success_rate(entry):.0%}，"
+              f"延遲 {entry['latency_ewma']:.1f} 秒，{state}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+頁面快照錄製與離線重播
+錄製模式：將造訪過的搜尋頁與個人檔案頁 HTML 存成快照
+重播模式：以靜態解析器處理快照，不需要瀏覽器與登入即可測試抽取邏輯與量測速度
+搜尋頁使用與 crawler.py 相同的抽取規格（連結位置的 XPath、頁碼選擇器與格式），
+修改線上抓取的規格後重播即可看出結果是否改變
+"""
+
+from html.parser import HTMLParser
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from functools import partial
+import csv
+import glob
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+
+from image import (
+    classify_page_content, parse_profile_description, parse_profile_header,
+    extract_username_from_url,
+)
+
+
+SEARCH_DIR = 'search'
+PROFILE_DIR = 'profile'
+
+# 沒有結束標籤的 HTML 元素
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+    'param', 'source', 'track', 'wbr',
+}
+
+# 離線選擇器支援的語法：標籤、.class、[屬性]、[屬性='值']、[屬性*='值']、[屬性^='值']，
+# 以空白（子孫）或 >（子元素）連接
+COMPOUND_PATTERN = re.compile(r"^([a-zA-Z][\w-]*|\*)?((?:\.[\w-]+|\[[^\]]+\])*)$")
+PART_PATTERN = re.compile(r"\.([\w-]+)|\[([\w-]+)(?:([*^]?=)['\"]?([^'\"\]]*)['\"]?)?\]")
+
+
+def record_snapshot(driver, snapshot_dir, kind, name):
+    """將目前頁面的 HTML 存成快照（kind 為 search 或 profile）"""
+    try:
+        folder = os.path.join(snapshot_dir, kind)
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"{name}.html")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(driver.page_source)
+        return path
+    except Exception as e:
+        print(f"儲存頁面快照時發生錯誤: {e}")
+        return None
+
+
+class SnapshotParser(HTMLParser):
+    """單次走訪 HTML，收集連結、meta、標頭文字與登入表單等抽取所需的資訊"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.text_parts = []
+        self.header_parts = []
+        self.has_login_form = False
+        self.has_header = False
+        self._main_depth = 0
+        self._header_depth = 0
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'meta':
+            key = attrs.get('property') or attrs.get('name')
+            if key and 'content' in attrs:
+                self.meta.setdefault(key, attrs['content'])
+        elif tag == 'input' and attrs.get('name') == 'username':
+            self.has_login_form = True
+        elif tag in ('script', 'style'):
+            self._skip_depth += 1
+        elif tag == 'main':
+            self._main_depth += 1
+        elif tag == 'header' and self._main_depth:
+            self.has_header = True
+            self._header_depth += 1
+        elif tag in ('br', 'div', 'p', 'li', 'section') and self._header_depth:
+            self.header_parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in ('script', 'style') and self._skip_depth:
+            self._skip_depth -= 1
+        elif tag == 'main' and self._main_depth:
+            self._main_depth -= 1
+        elif tag == 'header' and self._header_depth:
+            self._header_depth -= 1
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self.text_parts.append(data)
+        if self._header_depth:
+            self.header_parts.append(data)
+
+    @property
+    def text(self):
+        return ' '.join(part.strip() for part in self.text_parts if part.strip())
+
+    @property
+    def header_text(self):
+        return ''.join(self.header_parts)
+
+
+class TreeParser(HTMLParser):
+    """將 HTML 轉成 ElementTree 元素樹，供 XPath（ElementTree 支援的子集）與選擇器查詢"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = ET.Element('document')
+        self._stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        element = ET.SubElement(self._stack[-1], tag, {k: v or '' for k, v in attrs})
+        if tag not in VOID_ELEMENTS:
+            self._stack.append(element)
+
+    def handle_startendtag(self, tag, attrs):
+        ET.SubElement(self._stack[-1], tag, {k: v or '' for k, v in attrs})
+
+    def handle_endtag(self, tag):
+        # 關閉到對應的開始標籤為止，忽略沒有對應開始標籤的結束標籤
+        for depth in range(len(self._stack) - 1, 0, -1):
+            if self._stack[depth].tag == tag:
+                del self._stack[depth:]
+                break
+
+    def handle_data(self, data):
+        current = self._stack[-1]
+        if len(current):
+            current[-1].tail = (current[-1].tail or '') + data
+        else:
+            current.text = (current.text or '') + data
+
+
+def build_tree(html):
+    """解析 HTML，返回 (根元素, {子元素: 父元素})"""
+    parser = TreeParser()
+    parser.feed(html)
+    parser.close()
+    parents = {child: parent for parent in parser.root.iter() for child in parent}
+    return parser.root, parents
+
+
+def text_content(element):
+    return ''.join(element.itertext())
+
+
+def find_attribute(root, xpath, name):
+    """以 XPath 找到第一個元素並返回屬性（與 WebDriver 的 find_element 相同，找不到時拋出例外）"""
+    path = f".{xpath}" if xpath.startswith('/') else xpath
+    element = root.find(path)
+    if element is None:
+        raise LookupError(f"找不到元素: {xpath}")
+    return element.get(name)
+
+
+def _compound_matches(element, compound):
+    tag, parts = compound
+    if tag not in (None, '*') and element.tag != tag:
+        return False
+    classes = (element.get('class') or '').split()
+    for class_name, attr, op, value in parts:
+        if class_name:
+            if class_name not in classes:
+                return False
+            continue
+        actual = element.get(attr)
+        if actual is None:
+            return False
+        if op == '=' and actual != value:
+            return False
+        if op == '*=' and value not in actual:
+            return False
+        if op == '^=' and not actual.startswith(value):
+            return False
+    return True
+
+
+def _parse_selector(selector):
+    """將選擇器拆成 [(組合方式, (標籤, 條件))]，第一個組合方式為 None"""
+    steps = []
+    combinator = None
+    for token in selector.replace('>', ' > ').split():
+        if token == '>':
+            combinator = '>'
+            continue
+        match = COMPOUND_PATTERN.match(token)
+        if not match:
+            raise ValueError(f"離線重播不支援的選擇器: {selector}")
+        parts = [(m.group(1), m.group(2), m.group(3), m.group(4)) for m in PART_PATTERN.finditer(match.group(2))]
+        steps.append((combinator if steps else None, (match.group(1), parts)))
+        combinator = ' '
+    return steps
+
+
+def select(root, parents, selector):
+    """以 CSS 選擇器（子集）查詢元素，依文件順序返回"""
+    steps = _parse_selector(selector)
+
+    def matches(element, i):
+        if not _compound_matches(element, steps[i][1]):
+            return False
+        if i == 0:
+            return True
+        parent = parents.get(element)
+        if steps[i][0] == '>':
+            return parent is not None and matches(parent, i - 1)
+        while parent is not None:
+            if matches(parent, i - 1):
+                return True
+            parent = parents.get(parent)
+        return False
+
+    return [element for element in root.iter() if element is not root and matches(element, len(steps) - 1)]
+
+
+def find_page_info(root, parents, selectors, pattern):
+    """與 crawler.PAGE_INFO_SCRIPT 相同的步驟：先試候選選擇器，找不到時走訪所有文字節點
+
+    返回 (當前頁碼, 總頁碼, 選擇器)，找不到時返回 None
+    """
+    for selector in selectors:
+        try:
+            elements = select(root, parents, selector)
+        except ValueError as e:
+            print(e)
+            continue
+        for element in elements:
+            match = pattern.search(text_content(element))
+            if match:
+                return int(match.group(1)), int(match.group(2)), selector
+
+    for element in root.iter():
+        # 元素自己的文字節點：開頭的 text 與各子元素之後的 tail
+        nodes = [(element.text, element)] + [(child.tail, element) for child in element]
+        for text, owner in nodes:
+            if not text or '頁' not in text:
+                continue
+            match = pattern.search(text_content(owner))
+            if not match:
+                continue
+            selector = None
+            parent = parents.get(owner)
+            classes = (parent.get('class') or '').split() if parent is not None else []
+            if classes:
+                selector = f"{parent.tag}.{'.'.join(classes)} > {owner.tag}"
+            return int(match.group(1)), int(match.group(2)), selector
+    return None
+
+
+def parse_search_html(html, cached_selector=None):
+    """以與線上抓取相同的規格解析搜尋結果頁快照
+
+    返回 (連結列表, 當前頁碼, 總頁碼, 找到頁碼的選擇器)；cached_selector 為上一頁成功的選擇器
+    """
+    from crawler import PAGE_INFO_PATTERN, PAGE_INFO_SELECTORS, collect_slot_links
+
+    root, parents = build_tree(html)
+    links = collect_slot_links(lambda xpath, name: find_attribute(root, xpath, name))
+    selectors = list(PAGE_INFO_SELECTORS)
+    if cached_selector:
+        selectors.insert(0, cached_selector)
+    info = find_page_info(root, parents, selectors, PAGE_INFO_PATTERN)
+    if info:
+        return links, info[0], info[1], info[2]
+    return links, None, None, None
+
+
+def parse_profile_html(html, url=None):
+    """解析個人檔案頁快照，返回與 extract_profile_data 相同欄位的資料與結果分類"""
+    parser = SnapshotParser()
+    parser.feed(html)
+    url = url or parser.meta.get('og:url') or ''
+
+    status = classify_page_content({
+        'url': url,
+        'ready_state': 'complete',
+        'has_header': parser.has_header,
+        'has_login_form': parser.has_login_form,
+        'text': parser.text[:5000],
+    })
+
+    data = parse_profile_description(parser.meta.get('og:description') or parser.meta.get('description'))
+    data['bio'] = parse_profile_header(parser.header_text, data['full_name'])
+    data['url'] = url
+    data['username'] = extract_username_from_url(url) if url else None
+    data['status'] = status
+    return data
+
+
+def replay_snapshots(snapshot_dir, output_dir=None):
+    """重播資料夾內所有快照，輸出抽取結果並顯示每秒處理頁數"""
+    search_files = sorted(glob.glob(os.path.join(snapshot_dir, SEARCH_DIR, '*.html')))
+    profile_files = sorted(glob.glob(os.path.join(snapshot_dir, PROFILE_DIR, '*.html')))
+    output_dir = output_dir or snapshot_dir
+
+    start = time.perf_counter()
+    search_rows = []
+    cached_selector = None
+    for path in search_files:
+        with open(path, 'r', encoding='utf-8') as f:
+            links, current_page, total_pages, selector = parse_search_html(f.read(), cached_selector)
+        # 與 get_page_info 相同：成功的選擇器快取給下一頁優先使用
+        cached_selector = selector or cached_selector
+        name = os.path.splitext(os.path.basename(path))[0]
+        if not links:
+            print(f"警告：快照 {name} 沒有抓到連結")
+        for link in links:
+            search_rows.append({'snapshot': name, 'link': link,
+                                'current_page': current_page, 'total_pages': total_pages,
+                                'page_info_selector': selector})
+    search_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    profile_rows = []
+    for path in profile_files:
+        with open(path, 'r', encoding='utf-8') as f:
+            username = os.path.splitext(os.path.basename(path))[0]
+            data = parse_profile_html(f.read(), f"https://www.instagram.com/{username}/")
+        profile_rows.append(data)
+    profile_seconds = time.perf_counter() - start
+
+    if search_rows:
+        _write_rows(os.path.join(output_dir, 'replay_links.csv'), search_rows)
+    if profile_rows:
+        _write_rows(os.path.join(output_dir, 'replay_profiles.csv'), profile_rows)
+
+    if search_files:
+        print(f"搜尋頁: {len(search_files)} 頁，{len(search_rows)} 筆連結，"
+              f"{len(search_files) / max(search_seconds, 1e-9):.0f} 頁/秒")
+    if profile_files:
+        print(f"個人檔案頁: {len(profile_files)} 頁，"
+              f"{len(profile_files) / max(profile_seconds, 1e-9):.0f} 頁/秒")
+    return search_rows, profile_rows
+
+
+def _write_rows(path, rows):
+    """將字典列表寫成 CSV"""
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+    print(f"已寫入 {len(rows)} 筆結果到 {path}")
+
+
+def serve_snapshots(snapshot_dir, port=8000):
+    """以本機檔案伺服器提供快照，讓 Selenium 流程可以指向 http://localhost:port/search/... 重播"""
+    handler = partial(SimpleHTTPRequestHandler, directory=snapshot_dir)
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    print(f"快照伺服器啟動於 http://127.0.0.1:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """主函數"""
+    snapshot_dir = 'snapshots'
+
+    print("開始重播頁面快照...")
+    replay_snapshots(snapshot_dir)
+
+
+if __name__ == "__main__":
+    main()
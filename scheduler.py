@@ -0,0 +1,102 @@
+"""
+截圖排程
+依粉絲級距、上次截圖的新舊與重試狀態計算優先順序，
+並以實測的每筆處理時間估算剩餘時間與控制時間預算
+"""
+
+import csv
+import math
+import os
+import re
+import time
+
+
+# 優先順序權重：粉絲數（取 log10）、距上次截圖天數（上限 STALE_DAYS_CAP）、已重試次數
+PRIORITY_WEIGHTS = {
+    'followers': 1.0,
+    'staleness': 0.1,
+    'attempts': -0.5,
+}
+STALE_DAYS_CAP = 30
+
+# 每筆處理時間的指數移動平均係數，以及尚無實測值時的預設秒數
+RATE_ALPHA = 0.2
+DEFAULT_SECONDS_PER_PROFILE = 30
+
+
+def band_from_filename(csv_filename):
+    """從檔名（例如 link_20Kto40k.csv）取得粉絲級距，返回 (下限, 上限)，無法判斷時返回 None"""
+    match = re.search(r'(\d+)\s*[kK]\s*to\s*(\d+)\s*[kK]', os.path.basename(csv_filename))
+    if not match:
+        return None
+    return int(match.group(1)) * 1000, int(match.group(2)) * 1000
+
+
+def load_follower_counts(profile_csv):
+    """讀取個人檔案資料（profile.csv），返回 {username: 粉絲數}，同一帳號取最後一筆"""
+    counts = {}
+    if not profile_csv or not os.path.exists(profile_csv):
+        return counts
+    try:
+        with open(profile_csv, 'r', newline='', encoding='utf-8') as csvfile:
+            for row in csv.DictReader(csvfile):
+                if row.get('username') and row.get('followers'):
+                    counts[row['username']] = int(row['followers'])
+    except Exception as e:
+        print(f"讀取粉絲數時發生錯誤: {e}")
+    return counts
+
+
+def priority_score(followers=None, last_captured_at=None, attempts=0, now=None,
+                   weights=None):
+    """計算優先分數（越大越優先）"""
+    weights = weights or PRIORITY_WEIGHTS
+    now = now or time.time()
+
+    follower_score = math.log10(followers) if followers and followers > 0 else 0
+    if last_captured_at:
+        staleness = min((now - last_captured_at) / 86400, STALE_DAYS_CAP)
+    else:
+        staleness = STALE_DAYS_CAP  # 從未截圖視為最舊
+    return (weights.get('followers', 0) * follower_score
+            + weights.get('staleness', 0) * staleness
+            + weights.get('attempts', 0) * attempts)
+
+
+def due_for_refresh(last_captured_at, refresh_days, now=None):
+    """判斷已完成的帳號是否該重新截圖（refresh_days 為 None 表示不重新截圖，上次截圖時間不明時視為需要）"""
+    if not refresh_days:
+        return False
+    if not last_captured_at:
+        return True
+    now = now or time.time()
+    return now - last_captured_at >= refresh_days * 86400
+
+
+def update_rate(seconds_per_profile, elapsed):
+    """以指數移動平均更新每筆處理時間"""
+    if seconds_per_profile is None:
+        return elapsed
+    return RATE_ALPHA * elapsed + (1 - RATE_ALPHA) * seconds_per_profile
+
+
+def estimate_remaining(remaining, seconds_per_profile):
+    """估算剩餘秒數"""
+    return remaining * (seconds_per_profile or DEFAULT_SECONDS_PER_PROFILE)
+
+
+def within_budget(started_at, time_budget, seconds_per_profile, wait_seconds=0):
+    """判斷在時間預算內是否還來得及（先等待 wait_seconds 秒後）處理下一筆
+
+    time_budget 為 None 表示不限制
+    """
+    if not time_budget:
+        return True
+    next_cost = seconds_per_profile or DEFAULT_SECONDS_PER_PROFILE
+    return time.time() - started_at + max(wait_seconds, 0) + next_cost <= time_budget
+
+
+def format_eta(seconds):
+    """將秒數格式化為 時:分:秒"""
+    seconds = int(max(seconds, 0))
+    return f"{seconds // 3600}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,140 @@
+"""
+截圖效能追蹤
+透過 ChromeDriver 的 performance log 收集 Chrome 追蹤事件與網路事件，並以 CDP
+Performance.getMetrics 取得腳本、版面配置時間。每個個人檔案都會記錄摘要數據，
+抽樣或超過時間門檻的個人檔案另外保存完整追蹤檔（可用 chrome://tracing 或 Perfetto 開啟）
+"""
+
+import csv
+import json
+import os
+import random
+import time
+
+
+TRACE_CATEGORIES = "devtools.timeline,blink.user_timing,loading,netlog"
+TRACE_LOG = 'trace_log.csv'
+TRACE_LOG_FIELDS = [
+    'username', 'url', 'started_at', 'elapsed_s', 'navigation_s', 'capture_s',
+    'script_ms', 'layout_ms', 'recalc_style_ms', 'task_ms',
+    'bytes_transferred', 'requests', 'trace_file',
+]
+
+# Performance.getMetrics 的欄位（秒）對應到摘要欄位（毫秒）
+METRIC_FIELDS = {
+    'ScriptDuration': 'script_ms',
+    'LayoutDuration': 'layout_ms',
+    'RecalcStyleDuration': 'recalc_style_ms',
+    'TaskDuration': 'task_ms',
+}
+
+
+def enable_tracing(chrome_options, categories=TRACE_CATEGORIES):
+    """在 Chrome 選項中開啟 performance log 與追蹤事件收集"""
+    chrome_options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+    chrome_options.add_experimental_option('perfLoggingPrefs', {
+        'enableNetwork': True,
+        'enablePage': True,
+        'traceCategories': categories,
+    })
+    return chrome_options
+
+
+def _drain_log(driver):
+    """取出並清空 performance log，返回解析後的訊息列表"""
+    messages = []
+    try:
+        for entry in driver.get_log('performance'):
+            try:
+                messages.append(json.loads(entry['message'])['message'])
+            except (KeyError, ValueError):
+                continue
+    except Exception as e:
+        print(f"讀取 performance log 時發生錯誤: {e}")
+    return messages
+
+
+def _get_metrics(driver):
+    """取得 CDP Performance.getMetrics，返回 {名稱: 數值}"""
+    try:
+        driver.execute_cdp_cmd('Performance.enable', {})
+        result = driver.execute_cdp_cmd('Performance.getMetrics', {})
+        return {metric['name']: metric['value'] for metric in result.get('metrics', [])}
+    except Exception as e:
+        print(f"取得效能指標時發生錯誤: {e}")
+        return {}
+
+
+def begin_trace(driver, username, url):
+    """在導覽前開始追蹤，返回追蹤狀態"""
+    _drain_log(driver)  # 丟棄前一個頁面殘留的事件
+    return {
+        'username': username,
+        'url': url,
+        'start': time.time(),
+        'marks': {},
+        'metrics': _get_metrics(driver),
+    }
+
+
+def mark(trace, name):
+    """記錄某個階段完成的時間（trace 為 None 時不做任何事）"""
+    if trace is not None:
+        trace['marks'][name] = time.time()
+
+
+def end_trace(driver, trace, trace_dir, threshold=30, sample_rate=0.0):
+    """結束追蹤：寫入摘要數據，抽樣或耗時超過 threshold 秒時保存完整追蹤檔"""
+    end = time.time()
+    metrics = _get_metrics(driver)
+    messages = _drain_log(driver)
+    elapsed = end - trace['start']
+
+    # 網路用量：以 loadingFinished 的實際傳輸量加總
+    bytes_transferred = 0
+    requests = 0
+    for message in messages:
+        if message.get('method') == 'Network.loadingFinished':
+            bytes_transferred += message.get('params', {}).get('encodedDataLength', 0)
+            requests += 1
+
+    marks = trace['marks']
+    navigated = marks.get('navigated')
+    captured = marks.get('captured')
+    row = {
+        'username': trace['username'],
+        'url': trace['url'],
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(trace['start'])),
+        'elapsed_s': f"{elapsed:.2f}",
+        'navigation_s': f"{navigated - trace['start']:.2f}" if navigated else '',
+        'capture_s': f"{captured - navigated:.2f}" if captured and navigated else '',
+        'bytes_transferred': bytes_transferred,
+        'requests': requests,
+        'trace_file': '',
+    }
+    for name, field in METRIC_FIELDS.items():
+        delta = metrics.get(name, 0) - trace['metrics'].get(name, 0)
+        row[field] = f"{delta * 1000:.0f}"
+
+    try:
+        os.makedirs(trace_dir, exist_ok=True)
+
+        if elapsed > threshold or random.random() < sample_rate:
+            events = [m['params'] for m in messages if m.get('method') == 'Tracing.dataCollected']
+            trace_file = f"{trace['username']}-{int(trace['start'])}.json"
+            with open(os.path.join(trace_dir, trace_file), 'w', encoding='utf-8') as f:
+                json.dump({'traceEvents': events, 'metadata': row}, f)
+            row['trace_file'] = trace_file
+            reason = '超過門檻' if elapsed > threshold else '抽樣'
+            print(f"已保存追蹤檔（{reason}，{elapsed:.1f} 秒）: {trace_file}")
+
+        log_path = os.path.join(trace_dir, TRACE_LOG)
+        write_header = not os.path.exists(log_path)
+        with open(log_path, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=TRACE_LOG_FIELDS)
+            if write_header:
+                writer.writeheader()
+            writer.writerow(row)
+    except Exception as e:
+        print(f"寫入追蹤資料時發生錯誤: {e}")
+    return row
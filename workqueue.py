@@ -0,0 +1,309 @@
+"""
+截圖工作佇列（租約制）
+以 SQLite 檔案記錄每個 URL 的狀態，多個 worker 以租約方式領取工作：
+領取一批 URL 並設定到期時間、處理期間定期送出心跳延長租約、完成後回報結果，
+租約到期未完成的 URL 會回到佇列。跨機器時可用 run_coordinator 以 HTTP 提供同一份佇列
+"""
+
+from contextlib import closing
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import csv
+import json
+import os
+import sqlite3
+import time
+import urllib.request
+
+from capture_state import (
+    DONE_STATUSES, TRANSIENT_STATUSES, MAX_ATTEMPTS, retry_delay,
+)
+
+
+# 工作狀態
+TASK_PENDING = 'pending'
+TASK_LEASED = 'leased'
+TASK_DONE = 'done'
+TASK_FAILED = 'failed'
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+def open_queue(db_path):
+    """開啟（必要時建立）佇列資料庫"""
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS tasks (
+            url TEXT PRIMARY KEY,
+            seq INTEGER,
+            state TEXT NOT NULL DEFAULT 'pending',
+            worker TEXT,
+            lease_expires REAL,
+            available_at REAL NOT NULL DEFAULT 0,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            status TEXT,
+            updated_at REAL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS tasks_claim ON tasks (state, available_at, seq)")
+    return conn
+
+
+def enqueue_urls(conn, urls):
+    """加入 URL（已存在的 URL 不會重複加入），返回新增筆數"""
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        (start,) = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM tasks").fetchone()
+        cursor = conn.executemany(
+            "INSERT OR IGNORE INTO tasks (url, seq, updated_at) VALUES (?, ?, ?)",
+            [(url, start + i + 1, now) for i, url in enumerate(urls)],
+        )
+    return cursor.rowcount
+
+
+def enqueue_from_csv(conn, csv_filename):
+    """將 CSV 中 image_done 不為 true 的 URL 加入佇列"""
+    urls = []
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader, None)  # 跳過標題行
+        for row in reader:
+            if not row or not row[0].strip():
+                continue
+            image_done = row[1].strip().strip('"').lower() if len(row) > 1 else ""
+            if image_done != "true":
+                urls.append(row[0].strip().strip('"'))
+    added = enqueue_urls(conn, urls)
+    print(f"已從 {csv_filename} 加入 {added} 筆工作")
+    return added
+
+
+def release_expired(conn):
+    """將租約已到期的工作放回佇列，返回筆數"""
+    cursor = conn.execute(
+        "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+        "WHERE state = ? AND lease_expires < ?",
+        (TASK_PENDING, time.time(), TASK_LEASED, time.time()),
+    )
+    return cursor.rowcount
+
+
+def claim_batch(conn, worker_id, batch_size=5, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """領取一批可處理的 URL 並設定租約，返回 URL 列表"""
+    now = time.time()
+    with conn:
+        # BEGIN IMMEDIATE 取得寫入鎖，避免兩個 worker 領到同一筆
+        conn.execute("BEGIN IMMEDIATE")
+        release_expired(conn)
+        urls = [row[0] for row in conn.execute(
+            "SELECT url FROM tasks WHERE state = ? AND available_at <= ? ORDER BY seq LIMIT ?",
+            (TASK_PENDING, now, batch_size),
+        )]
+        conn.executemany(
+            "UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, updated_at = ? WHERE url = ?",
+            [(TASK_LEASED, worker_id, now + lease_seconds, now, url) for url in urls],
+        )
+    return urls
+
+
+def heartbeat(conn, worker_id, urls, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """延長該 worker 持有的租約，返回仍持有的筆數"""
+    now = time.time()
+    cursor = conn.executemany(
+        "UPDATE tasks SET lease_expires = ?, updated_at = ? WHERE url = ? AND worker = ? AND state = ?",
+        [(now + lease_seconds, now, url, worker_id, TASK_LEASED) for url in urls],
+    )
+    return cursor.rowcount
+
+
+def release_tasks(conn, worker_id, urls):
+    """將該 worker 尚未處理的租約立即放回佇列（worker 提前結束時使用），返回筆數"""
+    now = time.time()
+    with conn:
+        cursor = conn.executemany(
+            "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, updated_at = ? "
+            "WHERE url = ? AND worker = ? AND state = ?",
+            [(TASK_PENDING, now, url, worker_id, TASK_LEASED) for url in urls],
+        )
+    return cursor.rowcount
+
+
+def complete_task(conn, worker_id, url, status):
+    """回報處理結果：完成或永久失敗結束工作，暫時性失敗則延後放回佇列
+
+    租約已被其他 worker 取走時不會更新，返回 False
+    """
+    now = time.time()
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT attempts FROM tasks WHERE url = ? AND worker = ? AND state = ?",
+            (url, worker_id, TASK_LEASED),
+        ).fetchone()
+        if row is None:
+            return False
+
+        attempts = row[0] + 1
+        available_at = 0
+        if status in DONE_STATUSES:
+            state = TASK_DONE
+        elif status in TRANSIENT_STATUSES and attempts < MAX_ATTEMPTS:
+            state = TASK_PENDING
+            available_at = now + retry_delay(status, attempts)
+        else:
+            # 永久失敗（PERMANENT_STATUSES）或重試次數用盡
+            state = TASK_FAILED
+
+        conn.execute(
+            "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, available_at = ?, "
+            "attempts = ?, status = ?, updated_at = ? WHERE url = ?",
+            (state, available_at, attempts, status, now, url),
+        )
+    return True
+
+
+def queue_stats(conn):
+    """返回各狀態的筆數，以及尚在等待重試的筆數與最近一次可處理時間"""
+    stats = {state: 0 for state in (TASK_PENDING, TASK_LEASED, TASK_DONE, TASK_FAILED)}
+    for state, count in conn.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"):
+        stats[state] = count
+    waiting, next_available = conn.execute(
+        "SELECT COUNT(*), MIN(available_at) FROM tasks WHERE state = ? AND available_at > ?",
+        (TASK_PENDING, time.time()),
+    ).fetchone()
+    stats['waiting'] = waiting
+    stats['next_available_at'] = next_available
+    return stats
+
+
+def done_urls(conn):
+    """返回已完成的 URL 與結果分類"""
+    return conn.execute("SELECT url, status FROM tasks WHERE state = ?", (TASK_DONE,)).fetchall()
+
+
+def export_done_to_csv(queue_target, csv_filename):
+    """將佇列中已完成的 URL 一次寫回 CSV 的 image_done 欄位，返回更新筆數"""
+    done = {url for url, status in queue_call(queue_target, 'done')}
+    return write_done_to_csv(csv_filename, done)
+
+
+def write_done_to_csv(csv_filename, done):
+    """將 done 中的 URL 一次寫回 CSV 的 image_done 欄位（只讀寫一次檔案），返回更新筆數"""
+    if not done or not os.path.exists(csv_filename):
+        return 0
+
+    updated = 0
+    with open(csv_filename, 'r', newline='', encoding='utf-8') as csvfile:
+        rows = list(csv.reader(csvfile))
+    for row in rows[1:]:
+        if row and row[0].strip().strip('"') in done:
+            if len(row) > 1:
+                if row[1] != 'true':
+                    row[1] = 'true'
+                    updated += 1
+            else:
+                row.append('true')
+                updated += 1
+
+    tmp_path = f"{csv_filename}.tmp"
+    with open(tmp_path, 'w', newline='', encoding='utf-8') as csvfile:
+        csv.writer(csvfile).writerows(rows)
+    os.replace(tmp_path, csv_filename)
+    print(f"已將 {updated} 筆完成狀態寫回 {csv_filename}")
+    return updated
+
+
+# 可透過 HTTP 呼叫的操作
+QUEUE_OPERATIONS = {
+    'enqueue': lambda conn, urls: enqueue_urls(conn, urls),
+    'claim': lambda conn, worker_id, batch_size=5, lease_seconds=DEFAULT_LEASE_SECONDS:
+        claim_batch(conn, worker_id, batch_size, lease_seconds),
+    'heartbeat': lambda conn, worker_id, urls, lease_seconds=DEFAULT_LEASE_SECONDS:
+        heartbeat(conn, worker_id, urls, lease_seconds),
+    'complete': lambda conn, worker_id, url, status: complete_task(conn, worker_id, url, status),
+    'release': lambda conn, worker_id, urls: release_tasks(conn, worker_id, urls),
+    'stats': lambda conn: queue_stats(conn),
+    'done': lambda conn: done_urls(conn),
+}
+
+
+def queue_call(target, op, **kwargs):
+    """呼叫佇列操作：target 為資料庫路徑時直接存取，為 http:// 開頭時送到 coordinator"""
+    if target.startswith('http://') or target.startswith('https://'):
+        request = urllib.request.Request(
+            f"{target.rstrip('/')}/{op}",
+            data=json.dumps(kwargs).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST',
+        )
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return json.loads(response.read().decode('utf-8'))['result']
+
+    with closing(open_queue(target)) as conn:
+        return QUEUE_OPERATIONS[op](conn, **kwargs)
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    """coordinator 的 HTTP 處理：POST /<操作>，body 為 JSON 參數"""
+
+    db_path = None
+
+    def do_POST(self):
+        op = self.path.strip('/')
+        if op not in QUEUE_OPERATIONS:
+            self._reply(404, {'error': f'未知的操作: {op}'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            kwargs = json.loads(self.rfile.read(length) or b'{}')
+            with closing(open_queue(self.db_path)) as conn:
+                result = QUEUE_OPERATIONS[op](conn, **kwargs)
+            self._reply(200, {'result': result})
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+
+    def _reply(self, code, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_coordinator(db_path, host='127.0.0.1', port=8765):
+    """建立 coordinator 伺服器（呼叫 serve_forever 開始服務）"""
+    handler = type('BoundCoordinatorHandler', (CoordinatorHandler,), {'db_path': db_path})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def run_coordinator(db_path, host='127.0.0.1', port=8765):
+    """啟動 coordinator，讓其他機器的 worker 以 http://host:port 共用同一份佇列"""
+    server = make_coordinator(db_path, host, port)
+    print(f"佇列 coordinator 啟動於 http://{host}:{port}/（資料庫: {db_path}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def main():
+    """主函數：將 link.csv 加入佇列並啟動 coordinator"""
+    db_path = 'queue.db'
+    csv_filename = 'link.csv'
+
+    if os.path.exists(csv_filename):
+        with closing(open_queue(db_path)) as conn:
+            enqueue_from_csv(conn, csv_filename)
+    run_coordinator(db_path, host='0.0.0.0')
+
+
+if __name__ == "__main__":
+    main()